@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import time
+from typing import Optional, List
+
+import config
+from lulustream import LuluStreamClient
+
+logger = logging.getLogger(__name__)
+
+class AccountsExhausted(Exception):
+    """Every account refused the upload with a quota or rate-limit answer"""
+
+class LuluAccount:
+    """One LuluStream account with its own key, folder and category"""
+
+    def __init__(self, name: str, api_key: str, folder_id: int, category_id: int, weight: int = 1):
+        self.name = name
+        self.weight = max(1, weight)
+        self.client = LuluStreamClient(api_key, folder_id, category_id)
+
+        self.in_flight = 0
+        self.uploads = 0
+        self.failures = 0
+        self.backoff_until = 0.0
+        self.current_weight = 0  # Smooth weighted round-robin state
+
+    def is_available(self) -> bool:
+        return time.monotonic() >= self.backoff_until
+
+    def back_off(self, reason: str):
+        """Stop using this account for a while after a quota or rate-limit error"""
+        self.failures += 1
+        delay = min(
+            config.ACCOUNT_BACKOFF_SECONDS * 2 ** (self.failures - 1),
+            config.ACCOUNT_BACKOFF_MAX_SECONDS
+        )
+        self.backoff_until = time.monotonic() + delay
+        logger.warning(f"[ACCOUNTS] {self.name} backed off for {delay}s: {reason}")
+
+    def succeeded(self):
+        self.failures = 0
+        self.uploads += 1
+
+class AccountPool:
+    """Spread uploads across several LuluStream accounts"""
+
+    def __init__(self, accounts: List[LuluAccount], strategy: str = "weighted"):
+        self.accounts = accounts
+        self.strategy = strategy
+
+    @classmethod
+    def from_config(cls) -> "AccountPool":
+        accounts = [
+            LuluAccount(
+                name=str(entry.get("name") or f"account{i + 1}"),
+                api_key=entry["key"],
+                folder_id=int(entry.get("folder_id", config.FOLDER_ID)),
+                category_id=int(entry.get("category_id", config.CATEGORY_ID)),
+                weight=int(entry.get("weight", 1))
+            )
+            for i, entry in enumerate(config.LULUSTREAM_ACCOUNTS)
+        ]
+
+        # Single account setup from LULUSTREAM_API_KEY
+        if not accounts:
+            accounts = [LuluAccount("default", config.LULUSTREAM_API_KEY, config.FOLDER_ID, config.CATEGORY_ID)]
+
+        return cls(accounts, config.ACCOUNT_STRATEGY)
+
+    def get(self, name: Optional[str]) -> LuluAccount:
+        """Get the account an item was uploaded with (first account if unknown)"""
+        for account in self.accounts:
+            if account.name == name:
+                return account
+        return self.accounts[0]
+
+    def pick(self, exclude: tuple = ()) -> Optional[LuluAccount]:
+        """Pick an account for the next upload, None if all are backed off"""
+        candidates = [a for a in self.accounts if a.is_available() and a.name not in exclude]
+        if not candidates:
+            return None
+
+        if self.strategy == "least_loaded":
+            return min(candidates, key=lambda a: (a.in_flight / a.weight, a.uploads))
+
+        # Smooth weighted round-robin: the heaviest account is not picked in bursts
+        total = sum(a.weight for a in candidates)
+        for account in candidates:
+            account.current_weight += account.weight
+        best = max(candidates, key=lambda a: a.current_weight)
+        best.current_weight -= total
+        return best
+
+    async def acquire(self, exclude: tuple = ()) -> Optional[LuluAccount]:
+        """Wait for an available account and mark one upload in flight on it"""
+        while True:
+            account = self.pick(exclude)
+            if account:
+                account.in_flight += 1
+                return account
+
+            waiting = [a for a in self.accounts if a.name not in exclude]
+            if not waiting:
+                return None
+
+            delay = min(a.backoff_until for a in waiting) - time.monotonic()
+            logger.info(f"[ACCOUNTS] All accounts backed off, waiting {max(delay, 1):.0f}s")
+            await asyncio.sleep(max(delay, 1))
+
+    def release(self, account: LuluAccount):
+        account.in_flight = max(0, account.in_flight - 1)
+
+    def summary(self) -> str:
+        """One line per account for /stats"""
+        lines = []
+        for a in self.accounts:
+            state = "🟢" if a.is_available() else "⏸"
+            lines.append(f"{state} {a.name}: {a.in_flight} active, {a.uploads} uploaded")
+        return "\n".join(lines)
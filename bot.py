@@ -1,9 +1,19 @@
 # PART 1 - bot.py (Lines 1-500)
 
+import time
+
+# Cold start is measured from here, before the heavy imports below
+PROCESS_START = time.monotonic()
+
 import asyncio
+import hmac
 import logging
-from datetime import datetime
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+import signal
+from datetime import datetime, timedelta
+from bson import ObjectId
+from aiohttp import web
+from telegram import Bot, Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest, Forbidden, TelegramError
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -12,26 +22,35 @@ from telegram.ext import (
     ContextTypes,
     filters,
 )
+import channels
 import config
 import database
-from lulustream import LuluStreamClient
+import preflight
+import sender
+import worker
+from diagnostics import loop_monitor, sample_profile
+from logs import setup_logging
+from lulustream import provider_breaker
+from progress import format_size
 import re
 from urllib.parse import urlparse
 
 # Enable logging
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
-)
+setup_logging(config.LOG_LEVEL)
 logger = logging.getLogger(__name__)
 
-# Initialize LuluStream client
-lulu_client = LuluStreamClient()  # ✅ CORRECT
-
-# Global worker control
-worker_running = False
-worker_task = None
+# Global scheduler control
 scheduler_running = False
 scheduler_task = None
+archiver_task = None
+backfill_task = None
+
+# Startup progress reported by /ready
+startup_state = {
+    "ready": False,
+    "cold_start_seconds": None,
+    "steps_ms": {}
+}
 
 # ==================== HELPER FUNCTIONS ====================
 
@@ -39,44 +58,12 @@ def is_admin(user_id: int) -> bool:
     """Check if user is admin"""
     return user_id in config.ADMIN_IDS
 
-def format_size(size_bytes):
-    """Format bytes to human readable size"""
-    if not size_bytes:
-        return "Unknown"
-    
-    for unit in ['B', 'KB', 'MB', 'GB']:
-        if size_bytes < 1024.0:
-            return f"{size_bytes:.2f} {unit}"
-        size_bytes /= 1024.0
-    return f"{size_bytes:.2f} TB"
-
 def extract_video_url(text: str) -> str:
     """Extract video URL from message text"""
     url_pattern = r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+'
     urls = re.findall(url_pattern, text)
     return urls[0] if urls else None
 
-async def download_file_from_url(url: str, file_path: str) -> bool:
-    """Download file from URL"""
-    try:
-        import aiohttp
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status == 200:
-                    with open(file_path, 'wb') as f:
-                        while True:
-                            chunk = await response.content.read(1024 * 1024)  # 1MB chunks
-                            if not chunk:
-                                break
-                            f.write(chunk)
-                    return True
-                else:
-                    logger.error(f"Failed to download file: {response.status}")
-                    return False
-    except Exception as e:
-        logger.error(f"Download error: {e}")
-        return False
-
 # ==================== COMMAND HANDLERS ====================
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -102,13 +89,18 @@ I can automatically upload videos to LuluStream and post them to your channel.
 /start_scheduler - Start auto-posting
 /stop_scheduler - Stop auto-posting
 /post_now - Post one video immediately
+/schedule - Show upcoming posts
 /clear_failed - Clear failed uploads
 /queue - Show upload queue
+/priority - Set queue item priority
+/backfill - Queue storage channel history
+/lag - Show event loop stalls
+/profile - Profile the running bot
 
 Developed with ❤️
 """
     
-    await update.message.reply_text(welcome_text)
+    await sender.reply(update.message, welcome_text)
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show help message"""
@@ -119,7 +111,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 /start - Start the bot
 /help - Show this help message
 /stats - Show queue statistics
-/add_url <url> - Add video URL to queue
+/add_url <url> [url ...] [priority] - Add video URLs to queue
 /add_file - Upload video file directly
 
 **Admin Commands:**
@@ -128,8 +120,14 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 /start_scheduler - Start automatic posting
 /stop_scheduler - Stop automatic posting
 /post_now - Post one video immediately
-/queue - Show current upload queue
+/schedule - Preview the posting calendar
+/reorder <queue_id> <position> - Move a video in the calendar
+/queue [status] - Browse the queue (pending, uploading, uploaded, posted, failed, all)
 /clear_failed - Clear all failed uploads
+/backfill <first_id> <last_id> - Queue videos from storage channel history
+/priority <queue_id> <n> - Set upload priority (higher first)
+/lag - Event loop lag and the stack of the last stall
+/profile <seconds> - Sample the live process, get the hotspots as a file
 
 **How It Works:**
 1. Send video URL or file
@@ -140,12 +138,48 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 **Support:** Contact admin if you face any issues.
 """
     
-    await update.message.reply_text(help_text)
+    await sender.reply(update.message, help_text)
+
+def format_cache(cache: dict) -> str:
+    """Source cache hit rate and size from a worker heartbeat"""
+    if not cache:
+        return "no cache"
+    lookups = cache['hits'] + cache['misses']
+    rate = f"{cache['hits'] * 100 // lookups}%" if lookups else "-"
+    return f"cache {rate} hits ({cache['files']} files, {cache['bytes'] // (1024 * 1024)} MB)"
+
+def format_hosts(workers: list, limit: int = 5) -> str:
+    """Source host counters summed over all live workers"""
+    totals = {}
+    for w in workers:
+        for row in w.get('hosts') or []:
+            t = totals.setdefault(row['host'], {"requests": 0, "errors": 0, "bytes": 0, "peak": 0,
+                                                "limit": row['limit'], "wait_seconds": 0})
+            for key in ("requests", "errors", "bytes", "wait_seconds"):
+                t[key] += row[key]
+            t['peak'] = max(t['peak'], row['peak'])
+    
+    rows = sorted(totals.items(), key=lambda item: item[1]['bytes'], reverse=True)[:limit]
+    return "\n".join(
+        f"🌐 {host}: {t['requests']} req, {format_size(t['bytes'])}, {t['errors']} errors, "
+        f"peak {t['peak']}/{t['limit']}, waited {t['wait_seconds']:.0f}s"
+        for host, t in rows
+    ) or "No downloads yet"
 
 async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show queue statistics"""
     try:
         stats_data = await database.get_queue_stats()
+        workers = await database.get_live_workers()
+        
+        fleet_text = "\n".join(
+            f"🖥 {w['_id']} ({w.get('mode', '?')}): "
+            f"{', '.join(w.get('current_items') or []) or 'idle'}, "
+            f"{w.get('processed', 0)} done, concurrency {w.get('concurrency', '?')}, "
+            f"{w.get('prefetched', 0)} claimed ahead, "
+            f"{format_cache(w.get('cache'))}, max loop lag {w.get('loop_lag_ms', '?')}ms"
+            for w in workers
+        ) or "No live workers"
         
         stats_text = f"""
 📊 **Queue Statistics**
@@ -156,258 +190,317 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
 ✅ Uploaded: {stats_data['uploaded']}
 📤 Posted: {stats_data['posted']}
 ❌ Failed: {stats_data['failed']}
+🗄 Archived: {stats_data['archived']}
 
-🤖 Worker: {'🟢 Running' if worker_running else '🔴 Stopped'}
+🤖 Worker: {'🟢 Running' if worker.worker_running else '🔴 Stopped'}
 ⏰ Scheduler: {'🟢 Running' if scheduler_running else '🔴 Stopped'}
+✉️ Sender: {sender.get_sender().summary()}
+📣 Channels: {channels.get_channels().summary()}
+🐢 Event loop: {loop_monitor.summary()}
+
+🛠 **Workers** ({len(workers)})
+{fleet_text}
+
+👤 **Accounts**
+{worker.account_pool.summary()}
+
+📥 **Source Hosts**
+{format_hosts(workers)}
 """
         
-        await update.message.reply_text(stats_text)
+        await sender.reply(update.message, stats_text)
     except Exception as e:
-        await update.message.reply_text(f"❌ Error getting stats: {str(e)}")
+        await sender.reply(update.message, f"❌ Error getting stats: {str(e)}")
+
+async def queue_url(update: Update, url: str, probe: dict, priority: int) -> str:
+    """Queue one probed URL, returns its line for the reply"""
+    if not probe['ok']:
+        return f"❌ Not queued, link is dead ({probe['error']})\n🔗 URL: {url}"
+    
+    # Extract filename from URL
+    filename = url.split('/')[-1] or f"video_{datetime.now().timestamp()}.mp4"
+    
+    queue_id = await database.add_to_queue(
+        message_id=update.message.message_id,
+        file_name=filename,
+        file_url=url,
+        file_size=probe['size'] or None,
+        title=filename,
+        priority=priority,
+        chat_id=update.effective_chat.id,
+        preflight={k: probe[k] for k in ("status", "content_type", "accepts_ranges", "final_url", "checked_at")}
+    )
+    if not queue_id:
+        return f"❌ Failed to add to queue\n🔗 URL: {url}"
+    
+    size = format_size(probe['size']) if probe['size'] else "unknown"
+    resume = {True: "yes", False: "no"}.get(probe['accepts_ranges'], "unknown")
+    return (
+        f"✅ Added to queue!\n\n"
+        f"📝 File: {filename}\n"
+        f"🔗 URL: {url}\n"
+        f"💾 Size: {size} ({probe['content_type'] or 'unknown type'})\n"
+        f"⏯ Resumable: {resume}\n"
+        f"⭐ Priority: {priority}\n"
+        f"🆔 Queue ID: {queue_id}"
+    )
 
 async def add_url_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Add video URL to queue"""
+    """Add video URLs to queue, dead links are turned away"""
     if not context.args:
-        await update.message.reply_text("❌ Please provide a video URL\n\nUsage: /add_url <url>")
+        await sender.reply(update.message, "❌ Please provide a video URL\n\nUsage: /add_url <url> [url ...] [priority]")
         return
     
-    url = context.args[0]
+    args = list(context.args)
     
-    # Validate URL
-    try:
-        parsed = urlparse(url)
-        if not parsed.scheme or not parsed.netloc:
-            await update.message.reply_text("❌ Invalid URL format")
+    # A trailing number is the priority
+    priority = 0
+    if len(args) > 1 and args[-1].lstrip("-").isdigit():
+        priority = int(args.pop())
+    
+    # Validate URLs
+    for url in args:
+        try:
+            parsed = urlparse(url)
+            if not parsed.scheme or not parsed.netloc:
+                await sender.reply(update.message, f"❌ Invalid URL format: {url}")
+                return
+        except:
+            await sender.reply(update.message, f"❌ Invalid URL: {url}")
             return
-    except:
-        await update.message.reply_text("❌ Invalid URL")
-        return
     
     try:
-        # Extract filename from URL
-        filename = url.split('/')[-1] or f"video_{datetime.now().timestamp()}.mp4"
+        lines = []
+        urls = []
+        for url in dict.fromkeys(args):
+            existing = await database.find_existing_item(file_url=url)
+            if existing:
+                lines.append(f"⚠️ Already in queue ({existing['status']})\n🆔 Queue ID: {existing['_id']}")
+            else:
+                urls.append(url)
         
-        # Add to queue
-        queue_id = await database.add_to_queue(
-            message_id=update.message.message_id,
-            file_name=filename,
-            file_url=url,
-            title=filename
-        )
+        # All new links are probed at once, before any of them can take a worker slot
+        probes = await preflight.get_preflight().probe_many(urls)
+        for url, probe in zip(urls, probes):
+            lines.append(await queue_url(update, url, probe, priority))
         
-        if queue_id:
-            await update.message.reply_text(
-                f"✅ Added to queue!\n\n"
-                f"📝 File: {filename}\n"
-                f"🔗 URL: {url}\n"
-                f"🆔 Queue ID: {queue_id}\n\n"
-                f"Use /start_worker to begin uploading"
-            )
-        else:
-            await update.message.reply_text("❌ Failed to add to queue")
+        if any(line.startswith("✅") for line in lines):
+            lines.append("Use /start_worker to begin uploading")
+        await sender.reply(update.message, "\n\n".join(lines))
     
     except Exception as e:
         logger.error(f"Error adding URL: {e}")
-        await update.message.reply_text(f"❌ Error: {str(e)}")
+        await sender.reply(update.message, f"❌ Error: {str(e)}")
 
 async def handle_video_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle video file uploads"""
+    # Acknowledgements don't wait for their turn in the send queue, so a burst
+    # of forwarded videos is queued as fast as it arrives
     try:
         video = update.message.video or update.message.document
         
         if not video:
             return
         
+        existing = await database.find_existing_item(file_unique_id=video.file_unique_id)
+        if existing:
+            await sender.reply(
+                update.message,
+                f"⚠️ Already in queue ({existing['status']})\n🆔 Queue ID: {existing['_id']}",
+                wait=False
+            )
+            return
+        
         # Add to queue
         queue_id = await database.add_to_queue(
             message_id=update.message.message_id,
             file_name=video.file_name or f"video_{datetime.now().timestamp()}.mp4",
             file_id=video.file_id,
+            file_unique_id=video.file_unique_id,
             file_size=video.file_size,
-            title=video.file_name or "Untitled Video"
+            title=video.file_name or "Untitled Video",
+            chat_id=update.effective_chat.id
         )
         
         if queue_id:
-            await update.message.reply_text(
+            await sender.reply(
+                update.message,
                 f"✅ Video added to queue!\n\n"
                 f"📝 File: {video.file_name}\n"
                 f"💾 Size: {format_size(video.file_size)}\n"
                 f"🆔 Queue ID: {queue_id}\n\n"
-                f"Use /start_worker to begin uploading"
+                f"Use /start_worker to begin uploading",
+                wait=False
             )
         else:
-            await update.message.reply_text("❌ Failed to add video to queue")
+            await sender.reply(update.message, "❌ Failed to add video to queue", wait=False)
     
     except Exception as e:
         logger.error(f"Error handling video: {e}")
-        await update.message.reply_text(f"❌ Error: {str(e)}")
+        await sender.reply(update.message, f"❌ Error: {str(e)}", wait=False)
 
-# ==================== WORKER FUNCTIONS ====================
+# ==================== STORAGE CHANNEL ====================
 
-async def upload_worker():
-    """Background worker to upload videos to LuluStream"""
-    global worker_running
+def channel_video_item(message, message_id: int) -> dict:
+    """Build a queue item for a video in STORAGE_CHANNEL_ID, None if the message has no video"""
+    video = message.video or message.document
+    if not video:
+        return None
+    if not message.video and not (video.mime_type or "").startswith("video/"):
+        return None
     
-    logger.info("[WORKER] Started")
+    # Caption: first line is the title, the rest the description
+    caption = (message.caption or "").strip()
+    title, _, description = caption.partition("\n")
     
-    while worker_running:
-        try:
-            # Get pending uploads
-            pending = await database.get_pending_uploads(limit=1)
-            
-            if not pending:
-                logger.info("[WORKER] No pending uploads, waiting...")
-                await asyncio.sleep(10)
-                continue
-            
-            video = pending[0]
-            queue_id = str(video['_id'])
-            
-            logger.info(f"[WORKER] Processing: {video['file_name']}")
-            
-            # Update status to uploading
-            await database.update_upload_status(queue_id, "uploading")
-            
+    return database.build_queue_item(
+        message_id,
+        video.file_name or f"video_{message_id}.mp4",
+        file_id=video.file_id,
+        file_unique_id=video.file_unique_id,
+        file_size=video.file_size,
+        title=title.strip() or video.file_name or "Untitled Video",
+        description=description.strip() or None,
+        source_chat_id=config.STORAGE_CHANNEL_ID
+    )
+
+async def handle_channel_post(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Queue every video posted to the storage channel"""
+    try:
+        message = update.channel_post
+        item = channel_video_item(message, message.message_id)
+        if not item:
+            return
+        
+        if await database.find_existing_item(file_unique_id=item["file_unique_id"]):
+            logger.info(f"[CHANNEL] Skipped duplicate: {item['file_name']}")
+            return
+        
+        if await database.add_channel_videos([item]):
+            logger.info(f"[CHANNEL] Queued: {item['file_name']}")
+    
+    except Exception as e:
+        logger.error(f"[CHANNEL] Error handling channel post: {e}")
+
+async def backfill_channel(bot, first_id: int, last_id: int, report_chat_id: int):
+    """Queue every video in a range of STORAGE_CHANNEL_ID message IDs"""
+    # The Bot API can't read channel history, so each message is forwarded
+    # to a scratch chat to see its content, then deleted again
+    scratch_chat_id = config.BACKFILL_CHAT_ID or config.ADMIN_ID
+    batch = []
+    found = 0
+    queued = 0
+    failed = []  # Message IDs that could not be read
+    aborted = None
+    
+    logger.info(f"[BACKFILL] Scanning messages {first_id}-{last_id}")
+    
+    try:
+        for message_id in range(first_id, last_id + 1):
             try:
-                # Download file if URL provided
-                if video.get('file_url'):
-                    temp_file = f"temp_{queue_id}.mp4"
-                    logger.info(f"[WORKER] Downloading from URL: {video['file_url']}")
-                    
-                    success = await download_file_from_url(video['file_url'], temp_file)
-                    if not success:
-                        raise Exception("Failed to download file")
-                    
-                    file_path = temp_file
-                
-                # Download from Telegram if file_id provided
-                elif video.get('file_id'):
-                    # This requires bot instance, will be handled in main
-                    logger.error("[WORKER] Telegram file download not implemented yet")
-                    raise Exception("Telegram file download not supported in worker")
-                
-                else:
-                    raise Exception("No file URL or file ID provided")
-                
-                # Upload to LuluStream
-                logger.info(f"[WORKER] Uploading to LuluStream...")
-                result = lulu_client.upload_file(file_path, video['file_name'])
-                
-                if result and result.get('status') == 200:
-                    result_data = result.get('result', {})
-                    filecode = result_data.get('filecode')
-                    url = result_data.get('url')
-                    
-                    if filecode and url:
-                        logger.info(f"[WORKER] Upload successful! Filecode: {filecode}")
-                        
-                        # Get file info from LuluStream to get original title and thumbnail
-                        file_info = lulu_client.get_file_info(filecode)
-                        
-                        original_title = None
-                        thumbnail_url = None
-                        
-                        if file_info and file_info.get('status') == 200:
-                            result_data = file_info.get('result', {})
-                            if isinstance(result_data, list) and len(result_data) > 0:
-                                result_data = result_data[0]
-                            
-                            original_title = result_data.get('file_title') or result_data.get('title')
-                            thumbnail_url = result_data.get('player_img') or result_data.get('thumbnail')  # ✅ FIXED LINE
-                            
-                            logger.info(f"[WORKER] Original title: {original_title}")
-                            logger.info(f"[WORKER] Thumbnail: {thumbnail_url}")
-                        
-                        # Update status to uploaded
-                        await database.update_upload_status(
-                            queue_id,
-                            "uploaded",
-                            lulustream_file_code=filecode,
-                            lulustream_url=url,
-                            original_title=original_title,
-                            thumbnail_url=thumbnail_url
-                        )
-                        
-                        # Clean up temp file
-                        if video.get('file_url'):
-                            import os
-                            try:
-                                os.remove(file_path)
-                            except:
-                                pass
-                    else:
-                        raise Exception("No filecode or URL in response")
-                else:
-                    error_msg = result.get('msg', 'Unknown error') if result else 'No response'
-                    raise Exception(f"Upload failed: {error_msg}")
+                # Bulk priority: live posts and replies go out first, flood waits are handled by the queue
+                forwarded = await sender.send(
+                    scratch_chat_id,
+                    lambda: bot.forward_message(
+                        chat_id=scratch_chat_id,
+                        from_chat_id=config.STORAGE_CHANNEL_ID,
+                        message_id=message_id,
+                        disable_notification=True
+                    ),
+                    sender.PRIORITY_BULK
+                )
+            except BadRequest:
+                forwarded = None  # Deleted or service message
+            except Forbidden as e:
+                # The bot lost access to the channel or scratch chat, nothing further can be read
+                aborted = f"no access at message {message_id}: {e}"
+                logger.error(f"[BACKFILL] Stopped, {aborted}")
+                break
+            except TelegramError as e:
+                # Timeouts and network errors: skip the message, it is listed in the report
+                logger.error(f"[BACKFILL] Message {message_id} failed: {e}")
+                failed.append(message_id)
+                forwarded = None
             
-            except Exception as e:
-                logger.error(f"[WORKER] Upload failed: {e}")
+            if forwarded:
+                item = channel_video_item(forwarded, message_id)
+                if item:
+                    batch.append(item)
+                    found += 1
                 
-                # Increment retry count
-                retry_count = await database.increment_retry_count(queue_id)
-                
-                if retry_count >= config.MAX_RETRIES:
-                    await database.update_upload_status(
-                        queue_id,
-                        "failed",
-                        error_message=str(e)
-                    )
-                    logger.error(f"[WORKER] Max retries reached, marked as failed")
-                else:
-                    await database.update_upload_status(
-                        queue_id,
-                        "pending",
-                        error_message=str(e)
-                    )
-                    logger.info(f"[WORKER] Retry {retry_count}/{config.MAX_RETRIES}")
-        
-        except Exception as e:
-            logger.error(f"[WORKER] Error: {e}")
-            await asyncio.sleep(5)
+                await sender.send(
+                    scratch_chat_id,
+                    lambda copy_id=forwarded.message_id: bot.delete_message(chat_id=scratch_chat_id, message_id=copy_id),
+                    sender.PRIORITY_BULK,
+                    wait=False
+                )
+            
+            if len(batch) >= config.BACKFILL_BATCH_SIZE:
+                queued += await database.add_channel_videos(batch)
+                batch = []
+            
+            await asyncio.sleep(config.BACKFILL_DELAY_MS / 1000)
+    
+    except Exception as e:
+        aborted = str(e)
+        logger.error(f"[BACKFILL] Error: {e}")
     
-    logger.info("[WORKER] Stopped")
+    finally:
+        # Whatever was collected is queued and reported, even if the scan stopped early
+        queued += await database.add_channel_videos(batch)
+        
+        logger.info(f"[BACKFILL] Done: {found} videos found, {queued} newly queued, {len(failed)} failed")
+        if aborted:
+            text = f"❌ Backfill {first_id}-{last_id} stopped early: {aborted}"
+        elif failed:
+            text = f"⚠️ Backfill {first_id}-{last_id} done with errors"
+        else:
+            text = f"✅ Backfill {first_id}-{last_id} done"
+        text += f"\n\n🎬 Videos found: {found}\n📥 Newly queued: {queued}"
+        if failed:
+            shown = ", ".join(str(message_id) for message_id in failed[:20])
+            more = f" (+{len(failed) - 20} more)" if len(failed) > 20 else ""
+            text += f"\n⚠️ Failed to read {len(failed)}: {shown}{more}"
+        
+        await sender.send(report_chat_id, lambda: bot.send_message(chat_id=report_chat_id, text=text))
 
-# PART 2 - bot.py (Lines 401 onwards)
+# ==================== SCHEDULER FUNCTIONS ====================
 
 async def post_scheduler():
-    """Background scheduler to post videos to main channel"""
+    """Background scheduler: post items when their calendar slot is due"""
     global scheduler_running
     
     logger.info("[SCHEDULER] Started")
     
     while scheduler_running:
         try:
-            # Get uploaded but not posted videos
-            ready_to_post = await database.get_uploaded_not_posted(limit=1)
+            # New uploads join the calendar after everything already scheduled
+            scheduled = await database.schedule_uploaded()
+            if scheduled:
+                logger.info(f"[SCHEDULER] Scheduled {scheduled} new videos")
             
-            if not ready_to_post:
-                logger.info("[SCHEDULER] No videos ready to post, waiting...")
-                await asyncio.sleep(60)  # Check every minute
-                continue
-            
-            video = ready_to_post[0]
-            queue_id = str(video['_id'])
-            
-            logger.info(f"[SCHEDULER] Posting: {video['file_name']}")
-            
-            try:
-                # Post to main channel
-                success = await post_to_main_channel(video)
+            # Post everything that is due, the lease keeps other instances off it
+            while scheduler_running:
+                video = await database.claim_due_post(worker.WORKER_ID)
+                if not video:
+                    break
                 
-                if success:
+                queue_id = str(video['_id'])
+                logger.info(f"[SCHEDULER] Posting: {video['file_name']}")
+                
+                if await post_to_channels(video):
                     await database.update_upload_status(queue_id, "posted")
                     logger.info(f"[SCHEDULER] Posted successfully!")
-                    
-                    # Wait before posting next video
-                    await asyncio.sleep(config.POST_INTERVAL)
                 else:
-                    logger.error(f"[SCHEDULER] Failed to post")
-                    await asyncio.sleep(60)
+                    logger.error(f"[SCHEDULER] Failed to post to some channels, retrying those in a minute")
+                    await database.release_post(queue_id, datetime.utcnow() + timedelta(seconds=60))
             
-            except Exception as e:
-                logger.error(f"[SCHEDULER] Error posting: {e}")
-                await asyncio.sleep(60)
+            # Sleep until the next slot, re-checking at least every minute for new uploads
+            next_slot = await database.next_post_time()
+            delay = 60
+            if next_slot:
+                delay = min(delay, max(1, (next_slot - datetime.utcnow()).total_seconds()))
+            await asyncio.sleep(delay)
         
         except Exception as e:
             logger.error(f"[SCHEDULER] Error: {e}")
@@ -415,134 +508,149 @@ async def post_scheduler():
     
     logger.info("[SCHEDULER] Stopped")
 
-async def post_to_main_channel(video: dict) -> bool:
-    """Post video to main channel"""
-    try:
-        from telegram import Bot
-        bot = Bot(token=config.BOT_TOKEN)
-        
-        # Use original title from LuluStream if available, otherwise use queue title
-        title = video.get('original_title') or video['title']
+# ==================== ARCHIVER ====================
+
+async def archive_loop():
+    """Periodically move posted and old failed items to the archive"""
+    logger.info("[ARCHIVER] Started")
+    
+    while True:
+        try:
+            moved = await database.archive_items()
+            if moved:
+                logger.info(f"[ARCHIVER] Archived {moved} items")
+        except Exception as e:
+            logger.error(f"[ARCHIVER] Error: {e}")
         
-        # Create caption
-        caption = f"""
-😍{config.CHANNEL_TITLE}😍
+        await asyncio.sleep(config.ARCHIVE_INTERVAL_MINUTES * 60)
 
-🎬 {title}
+async def send_post(bot: Bot, target: channels.ChannelTarget, video: dict, photo: str = None):
+    """Post an item in one channel, with the photo if there is one; returns the sent message"""
+    caption = target.render(video)
+    keyboard = [
+        [InlineKeyboardButton(target.button, url=channels.watch_url(video))]
+    ]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
+    await target.pace()
+    
+    if photo:
+        try:
+            return await sender.send(target.chat_id, lambda: bot.send_photo(
+                chat_id=target.chat_id,
+                photo=photo,
+                caption=caption,
+                reply_markup=reply_markup
+            ), sender.PRIORITY_POST)
+        except Exception as e:
+            logger.error(f"[POST] {target.name}: failed to send with thumbnail: {e}")
+            # Fall back to text message
+    
+    return await sender.send(target.chat_id, lambda: bot.send_message(
+        chat_id=target.chat_id,
+        text=caption,
+        reply_markup=reply_markup
+    ), sender.PRIORITY_POST)
 
-{config.CAPTION_TEXT}
-"""
-        
-        # Create watch button (removed download button)
-        watch_url = f"https://lulustream.com/{video['lulustream_file_code']}"
-        
-        keyboard = [
-            [InlineKeyboardButton("▶️ Watch Now", url=watch_url)]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        # Try to send with thumbnail if available
-        thumbnail_url = video.get('thumbnail_url')
-        
-        if thumbnail_url:
-            try:
-                logger.info(f"[POST] Sending with thumbnail: {thumbnail_url}")
-                await bot.send_photo(
-                    chat_id=config.MAIN_CHANNEL_ID,
-                    photo=thumbnail_url,
-                    caption=caption,
-                    reply_markup=reply_markup
-                )
-                return True
-            except Exception as e:
-                logger.error(f"[POST] Failed to send with thumbnail: {e}")
-                # Fall back to text message
-        
-        # Send as text message if no thumbnail or thumbnail failed
-        await bot.send_message(
-            chat_id=config.MAIN_CHANNEL_ID,
-            text=caption,
-            reply_markup=reply_markup
-        )
-        
+async def post_to_channels(video: dict) -> bool:
+    """Post an item to every channel it still has to go to, True once none are left"""
+    targets = channels.get_channels().pending_for(video)
+    if not targets:
         return True
     
-    except Exception as e:
-        logger.error(f"[POST] Error posting to channel: {e}")
-        return False
+    bot = Bot(token=config.BOT_TOKEN)
+    queue_id = str(video['_id'])
+    
+    async def post(target: channels.ChannelTarget, photo: str) -> tuple:
+        """Returns (posted, file ID of the posted photo)"""
+        try:
+            message = await send_post(bot, target, video, photo)
+        except Exception as e:
+            target.failures += 1
+            logger.error(f"[POST] Error posting to {target.name}: {e}")
+            return False, None
+        
+        target.posted += 1
+        photo_id = message.photo[-1].file_id if message.photo else None
+        # Recorded at once, so a failure elsewhere never reposts here
+        await database.mark_channel_posted(queue_id, target.name, message.message_id, photo_id)
+        return True, photo_id
+    
+    photo = video.get('post_photo_id') or video.get('thumbnail_url')
+    results = []
+    
+    # Telegram fetches a thumbnail URL once, the other channels reuse the uploaded photo
+    if photo and not video.get('post_photo_id') and len(targets) > 1:
+        posted, photo_id = await post(targets[0], photo)
+        results.append(posted)
+        targets = targets[1:]
+        if posted:
+            # No photo ID means the thumbnail failed and the post went out as text
+            photo = photo_id
+    
+    results += [posted for posted, _ in await asyncio.gather(*(post(t, photo) for t in targets))]
+    return all(results)
 
 # ==================== ADMIN COMMANDS ====================
 
 async def start_worker_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start upload worker"""
     if not is_admin(update.effective_user.id):
-        await update.message.reply_text("❌ Admin only command")
+        await sender.reply(update.message, "❌ Admin only command")
         return
     
-    global worker_running, worker_task
-    
-    if worker_running:
-        await update.message.reply_text("⚠️ Worker is already running!")
+    if worker.worker_running:
+        await sender.reply(update.message, "⚠️ Worker is already running!")
         return
     
-    worker_running = True
-    worker_task = asyncio.create_task(upload_worker())
+    await worker.start_worker()
     
-    await update.message.reply_text("✅ Upload worker started!")
+    await sender.reply(update.message, "✅ Upload worker started!")
     logger.info("Upload worker started by admin")
 
 async def stop_worker_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Stop upload worker"""
     if not is_admin(update.effective_user.id):
-        await update.message.reply_text("❌ Admin only command")
+        await sender.reply(update.message, "❌ Admin only command")
         return
     
-    global worker_running, worker_task
-    
-    if not worker_running:
-        await update.message.reply_text("⚠️ Worker is not running!")
+    if not worker.worker_running:
+        await sender.reply(update.message, "⚠️ Worker is not running!")
         return
     
-    worker_running = False
-    
-    if worker_task:
-        worker_task.cancel()
-        try:
-            await worker_task
-        except asyncio.CancelledError:
-            pass
+    await worker.stop_worker()
     
-    await update.message.reply_text("✅ Upload worker stopped!")
+    await sender.reply(update.message, "✅ Upload worker stopped!")
     logger.info("Upload worker stopped by admin")
 
 async def start_scheduler_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start post scheduler"""
     if not is_admin(update.effective_user.id):
-        await update.message.reply_text("❌ Admin only command")
+        await sender.reply(update.message, "❌ Admin only command")
         return
     
     global scheduler_running, scheduler_task
     
     if scheduler_running:
-        await update.message.reply_text("⚠️ Scheduler is already running!")
+        await sender.reply(update.message, "⚠️ Scheduler is already running!")
         return
     
     scheduler_running = True
     scheduler_task = asyncio.create_task(post_scheduler())
     
-    await update.message.reply_text("✅ Post scheduler started!")
+    await sender.reply(update.message, "✅ Post scheduler started!")
     logger.info("Post scheduler started by admin")
 
 async def stop_scheduler_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Stop post scheduler"""
     if not is_admin(update.effective_user.id):
-        await update.message.reply_text("❌ Admin only command")
+        await sender.reply(update.message, "❌ Admin only command")
         return
     
     global scheduler_running, scheduler_task
     
     if not scheduler_running:
-        await update.message.reply_text("⚠️ Scheduler is not running!")
+        await sender.reply(update.message, "⚠️ Scheduler is not running!")
         return
     
     scheduler_running = False
@@ -554,100 +662,349 @@ async def stop_scheduler_command(update: Update, context: ContextTypes.DEFAULT_T
         except asyncio.CancelledError:
             pass
     
-    await update.message.reply_text("✅ Post scheduler stopped!")
+    await sender.reply(update.message, "✅ Post scheduler stopped!")
     logger.info("Post scheduler stopped by admin")
 
 async def post_now_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Post one video immediately"""
+    """Post the next scheduled video immediately"""
     if not is_admin(update.effective_user.id):
-        await update.message.reply_text("❌ Admin only command")
+        await sender.reply(update.message, "❌ Admin only command")
         return
     
     try:
-        # Get one uploaded video
-        ready_to_post = await database.get_uploaded_not_posted(limit=1)
+        await database.schedule_uploaded()
+        
+        # Next in the calendar, even if its slot is not due yet
+        video = await database.claim_due_post(worker.WORKER_ID, due_only=False)
         
-        if not ready_to_post:
-            await update.message.reply_text("⚠️ No videos ready to post")
+        if not video:
+            await sender.reply(update.message, "⚠️ No videos ready to post")
             return
         
-        video = ready_to_post[0]
         queue_id = str(video['_id'])
         
-        await update.message.reply_text(f"📤 Posting: {video['file_name']}...")
+        await sender.reply(update.message, f"📤 Posting: {video['file_name']}...")
         
-        success = await post_to_main_channel(video)
+        success = await post_to_channels(video)
         
         if success:
             await database.update_upload_status(queue_id, "posted")
-            await update.message.reply_text("✅ Posted successfully!")
+            await sender.reply(update.message, "✅ Posted successfully!")
         else:
-            await update.message.reply_text("❌ Failed to post")
+            await database.release_post(queue_id, video['scheduled_post_at'])
+            await sender.reply(update.message, "❌ Failed to post")
     
     except Exception as e:
         logger.error(f"Error in post_now: {e}")
-        await update.message.reply_text(f"❌ Error: {str(e)}")
+        await sender.reply(update.message, f"❌ Error: {str(e)}")
 
-async def queue_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Show upload queue"""
+async def schedule_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Preview the upcoming posting calendar"""
     if not is_admin(update.effective_user.id):
-        await update.message.reply_text("❌ Admin only command")
+        await sender.reply(update.message, "❌ Admin only command")
         return
     
     try:
-        pending = await database.get_pending_uploads(limit=10)
+        await database.schedule_uploaded()
+        upcoming = await database.get_schedule(limit=20)
         
-        if not pending:
-            await update.message.reply_text("📭 Queue is empty")
+        if not upcoming:
+            await sender.reply(update.message, "📅 Nothing scheduled")
             return
         
-        queue_text = "📋 **Upload Queue** (First 10)\n\n"
-        
-        for i, video in enumerate(pending, 1):
-            queue_text += f"{i}. {video['file_name']}\n"
-            queue_text += f"   Status: {video['status']}\n"
-            queue_text += f"   Added: {video['added_at'].strftime('%Y-%m-%d %H:%M')}\n\n"
+        lines = [f"📅 **Upcoming posts** (times in UTC)\n"]
+        for position, video in enumerate(upcoming, 1):
+            title = video.get('original_title') or video.get('title') or video['file_name']
+            lines.append(f"{position}. {video['scheduled_post_at']:%d %b %H:%M} • {title[:40]}\n   🆔 {video['_id']}")
+        lines.append("\nMove an item with /reorder <queue_id> <position>")
         
-        await update.message.reply_text(queue_text)
+        await sender.reply(update.message, "\n".join(lines))
+    except Exception as e:
+        logger.error(f"Error showing schedule: {e}")
+        await sender.reply(update.message, f"❌ Error: {str(e)}")
+
+async def reorder_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Move a scheduled item to another position in the calendar"""
+    if not is_admin(update.effective_user.id):
+        await sender.reply(update.message, "❌ Admin only command")
+        return
+    
+    if len(context.args) != 2:
+        await sender.reply(update.message, "❌ Usage: /reorder <queue_id> <position>")
+        return
+    
+    try:
+        queue_id = context.args[0]
+        position = int(context.args[1])
+        if not ObjectId.is_valid(queue_id) or position < 1:
+            raise ValueError
+    except ValueError:
+        await sender.reply(update.message, "❌ Usage: /reorder <queue_id> <position>")
+        return
+    
+    if await database.move_in_schedule(queue_id, position):
+        await sender.reply(update.message, f"✅ Moved to position {position}")
+    else:
+        await sender.reply(update.message, "❌ Item is not in the schedule")
+
+QUEUE_PAGE_SIZE = 10
+QUEUE_STATUSES = ("pending", "uploading", "uploaded", "posted", "failed", "all")
+EPOCH = datetime(1970, 1, 1)
+
+def encode_queue_cursor(status: str, direction: str, item: dict) -> str:
+    """Pack a keyset cursor into callback data (fits Telegram's 64 byte limit)"""
+    ms = (item['added_at'] - EPOCH) // timedelta(milliseconds=1)
+    return f"q:{status}:{direction}:{ms}:{item['_id']}"
+
+def decode_queue_cursor(data: str) -> tuple:
+    """Unpack callback data into (status, direction, (added_at, _id))"""
+    _, status, direction, ms, item_id = data.split(":")
+    return status, direction, (EPOCH + timedelta(milliseconds=int(ms)), ObjectId(item_id))
+
+async def render_queue_page(status: str, after: tuple = None, before: tuple = None):
+    """Build text and navigation buttons for one /queue page"""
+    items = await database.get_queue_page(
+        status=None if status == "all" else status,
+        after=after,
+        before=before,
+        limit=QUEUE_PAGE_SIZE
+    )
+    
+    # The extra item only tells there is one more page in that direction
+    has_more = len(items) > QUEUE_PAGE_SIZE
+    if before:
+        items = items[1:] if has_more else items
+        has_prev, has_next = has_more, True
+    else:
+        items = items[:QUEUE_PAGE_SIZE]
+        has_prev, has_next = bool(after), has_more
+    
+    if not items:
+        return f"📭 No {status} items", None
+    
+    queue_text = f"📋 **Upload Queue** ({status})\n\n"
+    
+    for video in items:
+        queue_text += f"• {video['file_name']}\n"
+        queue_text += f"   Status: {video['status']} | Size: {format_size(video.get('file_size'))}\n"
+        queue_text += f"   Added: {video['added_at'].strftime('%Y-%m-%d %H:%M')} | ID: {video['_id']}\n\n"
+    
+    buttons = []
+    if has_prev:
+        buttons.append(InlineKeyboardButton("◀️ Prev", callback_data=encode_queue_cursor(status, "p", items[0])))
+    if has_next:
+        buttons.append(InlineKeyboardButton("Next ▶️", callback_data=encode_queue_cursor(status, "n", items[-1])))
+    
+    return queue_text, InlineKeyboardMarkup([buttons]) if buttons else None
+
+async def queue_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show upload queue"""
+    if not is_admin(update.effective_user.id):
+        await sender.reply(update.message, "❌ Admin only command")
+        return
+    
+    status = context.args[0].lower() if context.args else "pending"
+    if status not in QUEUE_STATUSES:
+        await sender.reply(update.message, f"❌ Usage: /queue [{'|'.join(QUEUE_STATUSES)}]")
+        return
+    
+    try:
+        queue_text, reply_markup = await render_queue_page(status)
+        await sender.reply(update.message, queue_text, reply_markup=reply_markup)
     
     except Exception as e:
         logger.error(f"Error showing queue: {e}")
-        await update.message.reply_text(f"❌ Error: {str(e)}")
+        await sender.reply(update.message, f"❌ Error: {str(e)}")
+
+async def queue_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /queue Prev/Next buttons"""
+    query = update.callback_query
+    
+    if not is_admin(update.effective_user.id):
+        await query.answer("❌ Admin only", show_alert=True)
+        return
+    
+    await query.answer()
+    
+    try:
+        status, direction, cursor = decode_queue_cursor(query.data)
+        
+        if direction == "n":
+            queue_text, reply_markup = await render_queue_page(status, after=cursor)
+        else:
+            queue_text, reply_markup = await render_queue_page(status, before=cursor)
+        
+        await sender.send(
+            query.message.chat_id, lambda: query.edit_message_text(queue_text, reply_markup=reply_markup)
+        )
+    
+    except Exception as e:
+        logger.error(f"Error paging queue: {e}")
+
+async def priority_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Set priority of a queue item"""
+    if not is_admin(update.effective_user.id):
+        await sender.reply(update.message, "❌ Admin only command")
+        return
+    
+    if len(context.args) != 2:
+        await sender.reply(update.message, "❌ Usage: /priority <queue_id> <priority>")
+        return
+    
+    try:
+        priority = int(context.args[1])
+    except ValueError:
+        await sender.reply(update.message, "❌ Priority must be a number")
+        return
+    
+    try:
+        if await database.set_priority(context.args[0], priority):
+            await sender.reply(update.message, f"✅ Priority set to {priority}")
+        else:
+            await sender.reply(update.message, "❌ Queue item not found")
+    except Exception as e:
+        logger.error(f"Error setting priority: {e}")
+        await sender.reply(update.message, f"❌ Error: {str(e)}")
+
+async def backfill_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Queue videos from a range of storage channel message IDs"""
+    if not is_admin(update.effective_user.id):
+        await sender.reply(update.message, "❌ Admin only command")
+        return
+    
+    global backfill_task
+    
+    if backfill_task and not backfill_task.done():
+        await sender.reply(update.message, "⚠️ A backfill is already running!")
+        return
+    
+    try:
+        first_id, last_id = (int(arg) for arg in context.args)
+        if first_id < 1 or last_id < first_id:
+            raise ValueError
+    except ValueError:
+        await sender.reply(update.message, "❌ Usage: /backfill <first_message_id> <last_message_id>")
+        return
+    
+    backfill_task = asyncio.create_task(
+        backfill_channel(context.bot, first_id, last_id, update.effective_chat.id)
+    )
+    await sender.reply(update.message, f"🔄 Backfilling messages {first_id}-{last_id}...")
 
 async def clear_failed_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Clear all failed uploads"""
     if not is_admin(update.effective_user.id):
-        await update.message.reply_text("❌ Admin only command")
+        await sender.reply(update.message, "❌ Admin only command")
         return
     
     try:
         count = await database.clear_failed_uploads()
-        await update.message.reply_text(f"✅ Cleared {count} failed uploads")
+        await sender.reply(update.message, f"✅ Cleared {count} failed uploads")
     except Exception as e:
         logger.error(f"Error clearing failed: {e}")
-        await update.message.reply_text(f"❌ Error: {str(e)}")
+        await sender.reply(update.message, f"❌ Error: {str(e)}")
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Sample the live process for a few seconds and send the hottest lines as a file"""
+    if not is_admin(update.effective_user.id):
+        await sender.reply(update.message, "❌ Admin only command")
+        return
+    
+    try:
+        seconds = int(context.args[0]) if context.args else 10
+    except ValueError:
+        await sender.reply(update.message, "❌ Usage: /profile <seconds>")
+        return
+    seconds = max(1, min(seconds, config.PROFILE_MAX_SECONDS))
+    
+    await sender.reply(update.message, f"🔬 Profiling for {seconds}s...")
+    
+    # The sampler runs in a thread, so it also catches the loop while it is blocked
+    report = await asyncio.to_thread(sample_profile, seconds)
+    report = f"{loop_monitor.summary()}\n\n{report}"
+    
+    await sender.send(update.effective_chat.id, lambda: context.bot.send_document(
+        chat_id=update.effective_chat.id,
+        document=report.encode(),
+        filename=f"profile_{datetime.now():%Y%m%d_%H%M%S}.txt",
+        caption=f"🔬 {seconds}s profile"
+    ))
+
+async def lag_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show event loop lag and where the last stall was blocked"""
+    if not is_admin(update.effective_user.id):
+        await sender.reply(update.message, "❌ Admin only command")
+        return
+    
+    text = f"🐢 Event loop: {loop_monitor.summary()}"
+    if loop_monitor.stalls:
+        stall = loop_monitor.stalls[-1]
+        blocked = f"{stall['lag_ms']}ms" if stall['lag_ms'] is not None else "still blocked"
+        # The innermost frames are the interesting ones
+        text += (
+            f"\n\nLast stall {datetime.fromtimestamp(stall['at']):%H:%M:%S} ({blocked}):\n"
+            f"{stall['stack'][-3000:]}"
+        )
+    
+    await sender.reply(update.message, text)
 
 # ==================== MAIN ====================
 
+async def timed_step(name: str, coro):
+    """Await a startup step and record how long it took"""
+    started = time.monotonic()
+    try:
+        return await coro
+    finally:
+        startup_state["steps_ms"][name] = round((time.monotonic() - started) * 1000)
+
 async def post_init(application: Application):
     """Post initialization"""
-    # Connect to database
-    await database.connect_db()
+    global scheduler_running, scheduler_task, archiver_task
+    
+    loop_monitor.start()
+    
+    # Independent steps run concurrently
+    connected, _ = await asyncio.gather(
+        timed_step("mongo", database.connect_db()),
+        timed_step("upload_servers", worker.warm_upload_servers())
+    )
+    
+    if not connected:
+        logger.error("❌ Database unavailable, bot is not ready")
+        return
     logger.info("✅ Database connected")
+    
+    # Nothing is in flight yet, so any temp file without a checkpoint is left over from a crash
+    await timed_step("temp_cleanup", worker.cleanup_temp_files())
+    
+    # Resume work left over from the previous instance
+    requeued = await database.requeue_orphaned_uploads()
+    if requeued:
+        logger.info(f"✅ Requeued {requeued} interrupted uploads")
+    
+    if config.AUTO_START_WORKER:
+        await worker.start_worker()
+    
+    if config.AUTO_START_SCHEDULER:
+        scheduler_running = True
+        scheduler_task = asyncio.create_task(post_scheduler())
+    
+    # Keep upload_queue down to the active working set
+    if config.ARCHIVE_INTERVAL_MINUTES:
+        archiver_task = asyncio.create_task(archive_loop())
+    
+    startup_state["cold_start_seconds"] = round(time.monotonic() - PROCESS_START, 2)
+    startup_state["ready"] = True
+    logger.info(f"✅ Ready in {startup_state['cold_start_seconds']}s {startup_state['steps_ms']}")
 
 async def post_shutdown(application: Application):
     """Cleanup before shutdown"""
-    global worker_running, scheduler_running, worker_task, scheduler_task
+    global scheduler_running, scheduler_task
     
-    # Stop worker
-    if worker_running:
-        worker_running = False
-        if worker_task:
-            worker_task.cancel()
-            try:
-                await worker_task
-            except asyncio.CancelledError:
-                pass
+    # Stop worker, letting in-flight uploads finish or checkpoint
+    if worker.worker_running:
+        await worker.stop_worker(config.DRAIN_GRACE_SECONDS)
     
     # Stop scheduler
     if scheduler_running:
@@ -659,23 +1016,75 @@ async def post_shutdown(application: Application):
             except asyncio.CancelledError:
                 pass
     
+    # Stop archiver
+    if archiver_task:
+        archiver_task.cancel()
+        try:
+            await archiver_task
+        except asyncio.CancelledError:
+            pass
+    
+    # Let queued replies and posts go out
+    await sender.get_sender().drain(10)
+    
     # Close database
     await database.close_db()
     logger.info("✅ Cleanup completed")
 
 # ==================== HEALTH CHECK SERVER ====================
 
-from aiohttp import web
-
 async def health_check(request):
-    """Health check endpoint for Koyeb"""
+    """Liveness endpoint for Koyeb, the process is up"""
     return web.Response(text="OK", status=200)
 
-async def start_health_server():
-    """Start health check web server"""
+async def readiness_check(request):
+    """Readiness endpoint, 503 until startup finished and MongoDB answers"""
+    ready = startup_state["ready"]
+    checks = {}
+    
+    try:
+        latency = await asyncio.wait_for(database.ping_db(), timeout=5)
+        checks["mongo"] = {"ok": True, "latency_ms": round(latency, 1)}
+    except Exception as e:
+        checks["mongo"] = {"ok": False, "error": str(e) or type(e).__name__}
+        ready = False
+    
+    # Reported only: a LuluStream outage is not something a restart fixes
+    checks["lulustream"] = {"ok": provider_breaker.state != "open", "circuit": provider_breaker.state}
+    checks["worker"] = {"running": worker.worker_running, "in_flight": len(worker.current_items)}
+    
+    return web.json_response(
+        {"ready": ready, "startup": startup_state, "checks": checks},
+        status=200 if ready else 503
+    )
+
+async def telegram_webhook(request):
+    """Receive Telegram updates in webhook mode"""
+    # Telegram echoes the secret given to set_webhook in this header
+    secret = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not hmac.compare_digest(secret, config.WEBHOOK_SECRET):
+        return web.Response(status=403)
+    
+    try:
+        data = await request.json()
+    except ValueError:
+        return web.Response(status=400)
+    
+    # Handlers run on the application's queue, so Telegram gets its 200 right away
+    application = request.app["application"]
+    await application.update_queue.put(Update.de_json(data, application.bot))
+    return web.Response(text="OK")
+
+async def start_health_server(application: Application = None):
+    """Start health check web server (and the Telegram webhook endpoint in webhook mode)"""
     app = web.Application()
     app.router.add_get('/', health_check)
     app.router.add_get('/health', health_check)
+    app.router.add_get('/ready', readiness_check)
+    
+    if application:
+        app["application"] = application
+        app.router.add_post(config.WEBHOOK_PATH, telegram_webhook)
     
     runner = web.AppRunner(app)
     await runner.setup()
@@ -683,17 +1092,49 @@ async def start_health_server():
     await site.start()
     logger.info("✅ Health check server started on port 8000")
 
+async def run_webhook(application: Application):
+    """Serve Telegram updates from the health check server instead of polling"""
+    if not config.WEBHOOK_SECRET:
+        raise RuntimeError("WEBHOOK_SECRET is required in webhook mode")
+    
+    await start_health_server(application)
+    
+    await application.initialize()
+    await post_init(application)
+    await application.start()
+    
+    # Without a public URL the endpoint can still be fed locally, e.g. with curl
+    if config.WEBHOOK_URL:
+        await application.bot.set_webhook(
+            url=config.WEBHOOK_URL.rstrip("/") + config.WEBHOOK_PATH,
+            secret_token=config.WEBHOOK_SECRET,
+            allowed_updates=Update.ALL_TYPES,
+            max_connections=config.CONCURRENT_UPDATES
+        )
+    logger.info(f"🚀 Bot started! (webhook on {config.WEBHOOK_PATH})")
+    
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+    
+    await stop_event.wait()
+    
+    await application.stop()
+    await post_shutdown(application)
+    await application.shutdown()
+
 def main():
     """Start the bot"""
     
-    # Start health check server in background
-    import asyncio
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
-    loop.create_task(start_health_server())
     
     # Create application
-    application = Application.builder().token(config.BOT_TOKEN).build()
+    builder = Application.builder().token(config.BOT_TOKEN).concurrent_updates(config.CONCURRENT_UPDATES)
+    if config.USE_WEBHOOK:
+        builder = builder.updater(None)
+    application = builder.build()
     
     # Register handlers
     application.add_handler(CommandHandler("start", start))
@@ -707,11 +1148,33 @@ def main():
     application.add_handler(CommandHandler("start_scheduler", start_scheduler_command))
     application.add_handler(CommandHandler("stop_scheduler", stop_scheduler_command))
     application.add_handler(CommandHandler("post_now", post_now_command))
+    application.add_handler(CommandHandler("schedule", schedule_command))
+    application.add_handler(CommandHandler("reorder", reorder_command))
     application.add_handler(CommandHandler("queue", queue_command))
     application.add_handler(CommandHandler("clear_failed", clear_failed_command))
+    application.add_handler(CommandHandler("priority", priority_command))
+    application.add_handler(CallbackQueryHandler(queue_page_callback, pattern=r"^q:"))
+    
+    application.add_handler(CommandHandler("backfill", backfill_command))
+    application.add_handler(CommandHandler("profile", profile_command))
+    application.add_handler(CommandHandler("lag", lag_command))
     
     # Message handlers
-    application.add_handler(MessageHandler(filters.VIDEO | filters.Document.VIDEO, handle_video_message))
+    application.add_handler(MessageHandler(
+        filters.UpdateType.CHANNEL_POST & filters.Chat(config.STORAGE_CHANNEL_ID) & (filters.VIDEO | filters.Document.VIDEO),
+        handle_channel_post
+    ))
+    application.add_handler(MessageHandler(
+        filters.UpdateType.MESSAGE & (filters.VIDEO | filters.Document.VIDEO),
+        handle_video_message
+    ))
+    
+    if config.USE_WEBHOOK:
+        loop.run_until_complete(run_webhook(application))
+        return
+    
+    # Start health check server in background
+    loop.create_task(start_health_server())
     
     # Post init and shutdown
     application.post_init = post_init
@@ -723,4 +1186,3 @@ def main():
 
 if __name__ == "__main__":
     main()
-                
@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import re
+import time
+from typing import List
+
+import config
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+class TemplateFields(dict):
+    """Unknown {placeholders} stay in the caption instead of raising KeyError"""
+
+    def __missing__(self, key):
+        return "{" + key + "}"
+
+class ChannelTarget:
+    """One channel uploads are posted to, with its own caption, button, pacing and filters"""
+
+    def __init__(self, name: str, chat_id, caption: str = None, button: str = None,
+                 gap_seconds: float = 0, include: str = None, exclude: str = None,
+                 min_mb: int = 0, max_mb: int = 0, sources: list = None):
+        self.name = name
+        self.chat_id = chat_id
+        self.caption = caption or config.CAPTION_TEMPLATE
+        self.button = button or config.POST_BUTTON_TEXT
+        self.gap_seconds = gap_seconds
+
+        self.include = re.compile(include, re.IGNORECASE) if include else None
+        self.exclude = re.compile(exclude, re.IGNORECASE) if exclude else None
+        self.min_bytes = min_mb * MB
+        self.max_bytes = max_mb * MB
+        self.sources = set(sources or ())  # "telegram" and/or "url", empty = both
+
+        self.last_post = 0.0
+        self._lock = asyncio.Lock()
+
+        self.posted = 0
+        self.failures = 0
+
+    def accepts(self, video: dict) -> bool:
+        """Whether this channel wants the item at all"""
+        title = video.get('original_title') or video.get('title') or ""
+        if self.include and not self.include.search(title):
+            return False
+        if self.exclude and self.exclude.search(title):
+            return False
+
+        size = video.get('file_size') or 0
+        if self.min_bytes and size < self.min_bytes:
+            return False
+        if self.max_bytes and size > self.max_bytes:
+            return False
+
+        source = "url" if video.get('file_url') else "telegram"
+        return not self.sources or source in self.sources
+
+    def render(self, video: dict) -> str:
+        """Caption for an item from this channel's template"""
+        size = video.get('file_size') or 0
+        fields = TemplateFields(
+            title=video.get('original_title') or video['title'],
+            file_name=video.get('file_name', ""),
+            size_mb=f"{size / MB:.0f}",
+            url=watch_url(video),
+            channel_title=config.CHANNEL_TITLE,
+            caption_text=config.CAPTION_TEXT
+        )
+        return self.caption.format_map(fields)
+
+    async def pace(self):
+        """Wait until gap_seconds have passed since this channel's previous post"""
+        async with self._lock:
+            wait = self.last_post + self.gap_seconds - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self.last_post = time.monotonic()
+
+def watch_url(video: dict) -> str:
+    return f"https://lulustream.com/{video['lulustream_file_code']}"
+
+class ChannelSet:
+    """All channels every uploaded item is fanned out to"""
+
+    def __init__(self, targets: List[ChannelTarget]):
+        self.targets = targets
+
+    @classmethod
+    def from_config(cls) -> "ChannelSet":
+        targets = [
+            ChannelTarget(
+                # Names are Mongo field names in the item's posts
+                name=str(entry.get("name") or f"channel{i + 1}").replace(".", "_").lstrip("$"),
+                chat_id=entry["chat_id"],
+                caption=entry.get("caption"),
+                button=entry.get("button"),
+                gap_seconds=float(entry.get("gap_seconds", 0)),
+                include=entry.get("include"),
+                exclude=entry.get("exclude"),
+                min_mb=int(entry.get("min_mb", 0)),
+                max_mb=int(entry.get("max_mb", 0)),
+                sources=entry.get("sources")
+            )
+            for i, entry in enumerate(config.POST_CHANNELS)
+        ]
+
+        # Single channel setup from MAIN_CHANNEL_ID
+        if not targets:
+            targets = [ChannelTarget("main", config.MAIN_CHANNEL_ID)]
+
+        return cls(targets)
+
+    def pending_for(self, video: dict) -> List[ChannelTarget]:
+        """Channels the item still has to be posted to"""
+        done = video.get('posts') or {}
+        return [t for t in self.targets if t.name not in done and t.accepts(video)]
+
+    def summary(self) -> str:
+        return ", ".join(f"{t.name} {t.posted}✓/{t.failures}✗" for t in self.targets)
+
+_channels = None
+
+def get_channels() -> ChannelSet:
+    """Get the process-wide set of posting channels"""
+    global _channels
+    if _channels is None:
+        _channels = ChannelSet.from_config()
+    return _channels
@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+class ProviderUnavailable(Exception):
+    """LuluStream itself is failing (timeout, connection error, 5xx or open circuit)"""
+
+# ==================== CIRCUIT BREAKER ====================
+
+# How often callers check back while a half-open trial is running
+TRIAL_POLL_SECONDS = 5
+
+class CircuitBreaker:
+    """Stop calling a provider once its recent error rate is too high
+
+    closed    -> calls pass, outcomes are tracked over a sliding window
+    open      -> calls fail fast until reset_seconds have passed
+    half_open -> a few trial calls decide whether to close or re-open
+    """
+
+    def __init__(self, name: str, error_threshold: float = 0.5, min_calls: int = 5,
+                 window: int = 20, reset_seconds: float = 60, half_open_calls: int = 1):
+        self.name = name
+        self.error_threshold = error_threshold
+        self.min_calls = min_calls
+        self.reset_seconds = reset_seconds
+        self.half_open_calls = half_open_calls
+
+        self.state = "closed"
+        self.outcomes = deque(maxlen=window)  # True = success
+        self.opened_at = 0.0
+        self.trials = 0
+        # Calls come from worker threads (requests runs in asyncio.to_thread)
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Check if a call may go through, reserving a trial slot when half-open"""
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self.opened_at < self.reset_seconds:
+                    return False
+                self.state = "half_open"
+                self.trials = 0
+                logger.info(f"[CIRCUIT] {self.name} half-open, probing")
+
+            if self.state == "half_open":
+                if self.trials >= self.half_open_calls:
+                    return False
+                self.trials += 1
+
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self.state == "half_open":
+                logger.info(f"[CIRCUIT] {self.name} closed")
+                self.state = "closed"
+                self.outcomes.clear()
+            self.outcomes.append(True)
+
+    def record_failure(self):
+        with self._lock:
+            if self.state == "half_open":
+                self._open()
+                return
+
+            self.outcomes.append(False)
+            failures = self.outcomes.count(False)
+            if len(self.outcomes) >= self.min_calls and failures / len(self.outcomes) >= self.error_threshold:
+                self._open()
+
+    def _open(self):
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self.outcomes.clear()
+        logger.warning(f"[CIRCUIT] {self.name} open for {self.reset_seconds}s")
+
+    def retry_after(self) -> float:
+        """Seconds until a call may go through, non-zero while half-open trials are all taken"""
+        if self.state == "half_open":
+            # The trial may take a while, callers check back until it has decided
+            return 0 if self.trials < self.half_open_calls else min(self.reset_seconds, TRIAL_POLL_SECONDS)
+        if self.state != "open":
+            return 0
+        return max(0.0, self.reset_seconds - (time.monotonic() - self.opened_at))
+
+# ==================== ADAPTIVE CONCURRENCY ====================
+
+class AIMDLimiter:
+    """Concurrency limit that grows by one per window of successes and halves on provider errors"""
+
+    def __init__(self, max_limit: int, min_limit: int = 1, decrease_factor: float = 0.5):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.decrease_factor = decrease_factor
+
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self):
+        """Wait for a free slot under the current limit"""
+        async with self._cond:
+            while self.in_flight >= int(self.limit):
+                await self._cond.wait()
+            self.in_flight += 1
+
+    async def release(self, outcome: str = "neutral"):
+        """Free a slot; outcome is success or provider_error, anything else is neutral"""
+        async with self._cond:
+            self.in_flight -= 1
+
+            if outcome == "success":
+                # Additive increase: about +1 once every `limit` successes
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            elif outcome == "provider_error":
+                old = int(self.limit)
+                self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                if int(self.limit) != old:
+                    logger.warning(f"[AIMD] Concurrency reduced to {int(self.limit)}")
+
+            self._cond.notify_all()
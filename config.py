@@ -1,3 +1,4 @@
+import json
 import os
 from os import getenv
 from dotenv import load_dotenv
@@ -9,13 +10,52 @@ API_ID = int(getenv("API_ID", "0"))
 API_HASH = getenv("API_HASH", "")
 BOT_TOKEN = getenv("BOT_TOKEN", "")
 
+# Local Bot API server (e.g. http://localhost:8081), lifts the 20 MB file download limit
+TELEGRAM_API_URL = getenv("TELEGRAM_API_URL", "")
+
+# Receive updates by webhook on the health check server (port 8000) instead of polling
+USE_WEBHOOK = int(getenv("USE_WEBHOOK", "0"))
+
+# Public base URL of this service, e.g. https://my-app.koyeb.app (empty = don't register)
+WEBHOOK_URL = getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = getenv("WEBHOOK_PATH", "/telegram")
+
+# Secret Telegram sends back in X-Telegram-Bot-Api-Secret-Token (required for webhook mode)
+WEBHOOK_SECRET = getenv("WEBHOOK_SECRET", "")
+
+# How many updates are handled at the same time
+CONCURRENT_UPDATES = int(getenv("CONCURRENT_UPDATES", "16"))
+
+# Outgoing message rates: whole bot, per private chat, per group or channel
+SEND_GLOBAL_PER_SECOND = float(getenv("SEND_GLOBAL_PER_SECOND", "25"))
+SEND_CHAT_PER_SECOND = float(getenv("SEND_CHAT_PER_SECOND", "1"))
+SEND_GROUP_PER_MINUTE = float(getenv("SEND_GROUP_PER_MINUTE", "20"))
+
 # ==================== CHANNEL IDS ====================
 # Channel where you send files to be uploaded
 STORAGE_CHANNEL_ID = int(getenv("STORAGE_CHANNEL_ID", "0"))
 
+# Backfill: chat messages are forwarded to while scanning STORAGE_CHANNEL_ID history
+# (0 = ADMIN_ID), how many are inserted per batch, and delay (ms) between messages
+BACKFILL_CHAT_ID = int(getenv("BACKFILL_CHAT_ID", "0"))
+BACKFILL_BATCH_SIZE = int(getenv("BACKFILL_BATCH_SIZE", "100"))
+BACKFILL_DELAY_MS = int(getenv("BACKFILL_DELAY_MS", "100"))
+
 # Main channel where bot will post LuluStream links
 MAIN_CHANNEL_ID = int(getenv("MAIN_CHANNEL_ID", "0"))
 
+# Several posting channels as a JSON list (overrides MAIN_CHANNEL_ID), e.g.
+# [{"name": "main", "chat_id": -100123, "caption": "🎬 {title}", "button": "▶️ Watch",
+#   "gap_seconds": 30, "include": "trailer", "exclude": "sample", "min_mb": 50,
+#   "max_mb": 0, "sources": ["telegram", "url"]}]
+POST_CHANNELS = json.loads(getenv("POST_CHANNELS", "") or "[]")
+
+# Default post caption, fields: {title} {file_name} {size_mb} {url} {channel_title} {caption_text}
+CHANNEL_TITLE = getenv("CHANNEL_TITLE", "New Video")
+CAPTION_TEXT = getenv("CAPTION_TEXT", "")
+CAPTION_TEMPLATE = getenv("CAPTION_TEMPLATE", "😍{channel_title}😍\n\n🎬 {title}\n\n{caption_text}").replace("\\n", "\n")
+POST_BUTTON_TEXT = getenv("POST_BUTTON_TEXT", "▶️ Watch Now")
+
 # Admin user ID (your Telegram ID)
 ADMIN_ID = int(getenv("ADMIN_ID", "1206988513"))
 # Admin IDs list for worker commands
@@ -27,6 +67,29 @@ LULUSTREAM_API_KEY = getenv("LULUSTREAM_API_KEY", "")
 LULUSTREAM_UPLOAD_SERVER = "https://s1.myvideo.com/upload/01"
 LULUSTREAM_API_BASE = "https://lulustream.com/api"
 
+# Seconds an upload server URL from the API is reused
+UPLOAD_SERVER_CACHE_SECONDS = int(getenv("UPLOAD_SERVER_CACHE_SECONDS", "600"))
+
+# Several accounts as a JSON list (overrides LULUSTREAM_API_KEY), e.g.
+# [{"name": "a", "key": "xxx", "folder_id": 25, "category_id": 5, "weight": 2}]
+LULUSTREAM_ACCOUNTS = json.loads(getenv("LULUSTREAM_ACCOUNTS", "") or "[]")
+
+# How uploads are spread across accounts: weighted (round-robin) or least_loaded
+ACCOUNT_STRATEGY = getenv("ACCOUNT_STRATEGY", "weighted").lower()
+
+# Back-off (seconds) for an account after a quota/rate-limit error, doubles on repeats
+ACCOUNT_BACKOFF_SECONDS = int(getenv("ACCOUNT_BACKOFF_SECONDS", "300"))
+ACCOUNT_BACKOFF_MAX_SECONDS = int(getenv("ACCOUNT_BACKOFF_MAX_SECONDS", "3600"))
+
+# Circuit breaker: open when this share of the last CIRCUIT_WINDOW calls failed
+CIRCUIT_ERROR_THRESHOLD = float(getenv("CIRCUIT_ERROR_THRESHOLD", "0.5"))
+CIRCUIT_MIN_CALLS = int(getenv("CIRCUIT_MIN_CALLS", "5"))
+CIRCUIT_WINDOW = int(getenv("CIRCUIT_WINDOW", "20"))
+
+# Seconds an open circuit waits before trial requests, and how many trials
+CIRCUIT_RESET_SECONDS = int(getenv("CIRCUIT_RESET_SECONDS", "60"))
+CIRCUIT_HALF_OPEN_CALLS = int(getenv("CIRCUIT_HALF_OPEN_CALLS", "1"))
+
 # ==================== UPLOAD SETTINGS ====================
 # LuluStream folder ID (where videos will be uploaded)
 FOLDER_ID = int(getenv("FOLDER_ID", "25"))
@@ -43,6 +106,94 @@ FILE_PUBLIC = int(getenv("FILE_PUBLIC", "1"))
 # Adult flag (1 = adult content, 0 = normal)
 FILE_ADULT = int(getenv("FILE_ADULT", "1"))
 
+# Max upload attempts before an item is marked failed
+MAX_RETRIES = int(getenv("MAX_RETRIES", "3"))
+
+# Order in which pending items are uploaded:
+# fifo = oldest first, priority = highest priority then oldest,
+# smallest = smallest file_size first
+QUEUE_POLICY = getenv("QUEUE_POLICY", "fifo").lower()
+
+# ==================== WORKERS ====================
+# Start the in-process worker / scheduler at boot instead of waiting for /start_worker, /start_scheduler
+AUTO_START_WORKER = int(getenv("AUTO_START_WORKER", "0"))
+AUTO_START_SCHEDULER = int(getenv("AUTO_START_SCHEDULER", "0"))
+
+# Max uploads in flight per worker process, shrinks automatically during LuluStream errors
+WORKER_CONCURRENCY = int(getenv("WORKER_CONCURRENCY", "3"))
+
+# Items claimed ahead so a free slot starts the next one without a DB query
+# (0 = as many as the current concurrency)
+PREFETCH_CLAIMS = int(getenv("PREFETCH_CLAIMS", "0"))
+
+# Seconds between worker heartbeats
+WORKER_HEARTBEAT_SECONDS = int(getenv("WORKER_HEARTBEAT_SECONDS", "15"))
+
+# A worker without a heartbeat for this long is dead and its uploads are requeued
+WORKER_TIMEOUT_SECONDS = int(getenv("WORKER_TIMEOUT_SECONDS", "60"))
+
+# Live progress messages for each transfer (1 = on, 0 = off)
+PROGRESS_UPDATES = int(getenv("PROGRESS_UPDATES", "1"))
+
+# Seconds between edits of a progress message (Telegram limits edit rate)
+PROGRESS_EDIT_SECONDS = int(getenv("PROGRESS_EDIT_SECONDS", "5"))
+
+# Minutes between sweeps that match interrupted uploads to files already on LuluStream (0 = off)
+RECONCILE_INTERVAL_MINUTES = int(getenv("RECONCILE_INTERVAL_MINUTES", "30"))
+
+# File list pages (100 files each) read per account and sweep
+RECONCILE_MAX_PAGES = int(getenv("RECONCILE_MAX_PAGES", "10"))
+
+# Seconds in-flight uploads get to finish on shutdown before they are requeued
+DRAIN_GRACE_SECONDS = int(getenv("DRAIN_GRACE_SECONDS", "60"))
+
+# ==================== TEMP STORAGE ====================
+# Directory for in-flight downloads (can be a tmpfs or a dedicated volume)
+TEMP_DIR = getenv("TEMP_DIR", "temp")
+
+# Max disk space (MB) used by in-flight downloads (0 = limited by free space only)
+TEMP_DISK_LIMIT_MB = int(getenv("TEMP_DISK_LIMIT_MB", "0"))
+
+# Free space (MB) always left untouched on the temp volume
+TEMP_DISK_HEADROOM_MB = int(getenv("TEMP_DISK_HEADROOM_MB", "512"))
+
+# Size (MB) reserved for files whose size is unknown
+TEMP_UNKNOWN_SIZE_MB = int(getenv("TEMP_UNKNOWN_SIZE_MB", "2048"))
+
+# Move the MP4 moov box to the front before uploading (needs a second copy of the file on disk)
+FASTSTART = int(getenv("FASTSTART", "0"))
+
+# Files with a bigger moov box are uploaded as they are
+FASTSTART_MAX_MOOV_MB = int(getenv("FASTSTART_MAX_MOOV_MB", "64"))
+
+# Downloaded sources kept (MB) so retries skip the download, least recently used go first (0 = off)
+SOURCE_CACHE_MB = int(getenv("SOURCE_CACHE_MB", "2048"))
+
+# ==================== SOURCE DOWNLOADS ====================
+# Parallel connections to one source host
+HTTP_PER_HOST_LIMIT = int(getenv("HTTP_PER_HOST_LIMIT", "4"))
+
+# Per-host overrides as JSON, e.g. {"cdn.example.com": 2}
+HTTP_HOST_LIMITS = json.loads(getenv("HTTP_HOST_LIMITS", "") or "{}")
+
+# Parallel connections across all hosts
+HTTP_MAX_CONNECTIONS = int(getenv("HTTP_MAX_CONNECTIONS", "100"))
+
+# How long resolved host addresses are reused (seconds)
+HTTP_DNS_CACHE_SECONDS = int(getenv("HTTP_DNS_CACHE_SECONDS", "300"))
+
+# Timeouts in seconds (0 = none); read is the longest gap between received chunks
+HTTP_CONNECT_TIMEOUT = float(getenv("HTTP_CONNECT_TIMEOUT", "30"))
+HTTP_READ_TIMEOUT = float(getenv("HTTP_READ_TIMEOUT", "120"))
+HTTP_TOTAL_TIMEOUT = float(getenv("HTTP_TOTAL_TIMEOUT", "0"))
+
+# URLs probed at the same time when queued, and the timeout (seconds) per probe
+PREFLIGHT_CONCURRENCY = int(getenv("PREFLIGHT_CONCURRENCY", "8"))
+PREFLIGHT_TIMEOUT = float(getenv("PREFLIGHT_TIMEOUT", "15"))
+
+# Seconds a probe result is reused for the same URL
+PREFLIGHT_CACHE_SECONDS = int(getenv("PREFLIGHT_CACHE_SECONDS", "600"))
+
 # ==================== SCHEDULER SETTINGS ====================
 # How many videos to post per batch
 VIDEOS_PER_BATCH = int(getenv("VIDEOS_PER_BATCH", "10"))
@@ -54,5 +205,28 @@ POST_INTERVAL_MINUTES = int(getenv("POST_INTERVAL_MINUTES", "60"))
 MONGO_URI = getenv("MONGO_URI", "mongodb://localhost:27017")
 MONGO_DB = getenv("MONGO_DB", "lulustream_bot")
 
+# Retry, failure and posted marks are batched into one bulk write this often (0 = write each at once)
+WRITE_BUFFER_FLUSH_MS = int(getenv("WRITE_BUFFER_FLUSH_MS", "500"))
+
+# Flush early once this many items have buffered writes
+WRITE_BUFFER_MAX_OPS = int(getenv("WRITE_BUFFER_MAX_OPS", "100"))
+
+# ==================== ARCHIVE ====================
+# Minutes between archive runs (0 = never archive)
+ARCHIVE_INTERVAL_MINUTES = int(getenv("ARCHIVE_INTERVAL_MINUTES", "30"))
+
+# Posted items are archived after this many hours, failed items after this many days
+ARCHIVE_POSTED_AFTER_HOURS = int(getenv("ARCHIVE_POSTED_AFTER_HOURS", "24"))
+ARCHIVE_FAILED_AFTER_DAYS = int(getenv("ARCHIVE_FAILED_AFTER_DAYS", "7"))
+
+# Delete archived items after this many days (0 = keep forever)
+ARCHIVE_TTL_DAYS = int(getenv("ARCHIVE_TTL_DAYS", "0"))
+
 # ==================== LOGGING ====================
 LOG_LEVEL = getenv("LOG_LEVEL", "INFO")
+
+# Log the stack of anything blocking the event loop longer than this (ms, 0 = off)
+LOOP_LAG_THRESHOLD_MS = int(getenv("LOOP_LAG_THRESHOLD_MS", "500"))
+
+# Longest /profile run (seconds)
+PROFILE_MAX_SECONDS = int(getenv("PROFILE_MAX_SECONDS", "60"))
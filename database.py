@@ -1,5 +1,10 @@
+import asyncio
+import time
+from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorClient
-from datetime import datetime
+from pymongo import IndexModel, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from datetime import datetime, timedelta
 from typing import Optional, List
 import config
 
@@ -7,6 +12,12 @@ import config
 mongo_client = None
 db = None
 
+# Write-behind buffer: queue_id -> merged {"$set": ..., "$inc": ...}
+_buffered_writes = {}
+_flush_now = None
+_flusher_task = None
+_flusher_stopping = False
+
 # ==================== DATABASE CONNECTION ====================
 async def connect_db():
     """Connect to MongoDB"""
@@ -21,60 +32,237 @@ async def connect_db():
         print("✅ Connected to MongoDB successfully!")
         
         # Create indexes for better performance
-        await db.upload_queue.create_index("status")
-        await db.upload_queue.create_index("added_at")
-        await db.upload_queue.create_index("message_id")
+        # One createIndexes round trip per collection, all collections at once
+        queue_indexes = [
+            IndexModel("status"),
+            IndexModel("added_at"),
+            IndexModel("message_id"),
+            
+            # One compound index per claim policy so the claim query never sorts in memory
+            IndexModel([("status", 1), ("added_at", 1), ("_id", 1)]),
+            IndexModel([("added_at", 1), ("_id", 1)]),
+            IndexModel([("status", 1), ("priority", -1), ("added_at", 1)]),
+            IndexModel([("status", 1), ("file_size", 1), ("added_at", 1)]),
+            
+            # Posting calendar: due items by slot time
+            IndexModel([("status", 1), ("scheduled_post_at", 1), ("schedule_seq", 1)]),
+            
+            # Dedupe lookups
+            IndexModel("file_url", sparse=True),
+            IndexModel("file_unique_id", sparse=True),
+            IndexModel("lulustream_file_code", sparse=True),
+        ]
+        
+        # Archive of posted and old failed items
+        archive_indexes = [
+            IndexModel([("status", 1), ("posted_at", -1)]),
+            IndexModel("file_url", sparse=True),
+            IndexModel("file_unique_id", sparse=True),
+            IndexModel("lulustream_file_code", sparse=True),
+        ]
+        if config.ARCHIVE_TTL_DAYS:
+            archive_indexes.append(
+                IndexModel("archived_at", expireAfterSeconds=config.ARCHIVE_TTL_DAYS * 86400)
+            )
         
+        # Worker registry, entries of dead workers expire on their own
+        worker_indexes = [IndexModel("last_seen", expireAfterSeconds=config.WORKER_TIMEOUT_SECONDS)]
+        
+        await asyncio.gather(
+            db.upload_queue.create_indexes(queue_indexes),
+            db.upload_archive.create_indexes(archive_indexes),
+            db.workers.create_indexes(worker_indexes),
+        )
+        
+        start_write_flusher()
         return True
     except Exception as e:
         print(f"❌ MongoDB connection failed: {e}")
         return False
 
 async def close_db():
-    """Close MongoDB connection"""
+    """Flush buffered writes and close MongoDB connection"""
     global mongo_client
+    await stop_write_flusher()
     if mongo_client:
         mongo_client.close()
         print("👋 MongoDB connection closed")
 
+# ==================== WRITE-BEHIND ====================
+# Status changes that can afford to land a little later (retries, failures,
+# posted marks) are merged per item and sent in one bulk_write. Claims,
+# checkpoints and upload results are never buffered.
+
+def buffer_update(queue_id: str, set_fields: dict = None, inc_fields: dict = None):
+    """Queue an update for the next flush, merged with earlier ones for the same item"""
+    _merge_update(ObjectId(queue_id), {"$set": dict(set_fields or {}), "$inc": dict(inc_fields or {})})
+    
+    if len(_buffered_writes) >= config.WRITE_BUFFER_MAX_OPS and _flush_now:
+        _flush_now.set()
+
+def _merge_update(_id: ObjectId, update: dict):
+    current = _buffered_writes.setdefault(_id, {"$set": {}, "$inc": {}})
+    current["$set"].update(update["$set"])
+    for key, n in update["$inc"].items():
+        current["$inc"][key] = current["$inc"].get(key, 0) + n
+
+async def flush_writes() -> int:
+    """Send all buffered updates in one unordered bulk_write, returns how many were written"""
+    global _buffered_writes
+    
+    if not _buffered_writes or db is None:
+        return 0
+    
+    batch, _buffered_writes = _buffered_writes, {}
+    operations = [
+        UpdateOne({"_id": _id}, {op: fields for op, fields in update.items() if fields})
+        for _id, update in batch.items()
+    ]
+    
+    try:
+        result = await db.upload_queue.bulk_write(operations, ordered=False)
+        return result.modified_count
+    except BulkWriteError as e:
+        # Rejected documents would be rejected again, the rest went through
+        print(f"[ERROR] Flush writes failed for {len(e.details.get('writeErrors', []))} items: {e}")
+        return 0
+    except asyncio.CancelledError:
+        # Cut off mid-flush, the batch may not have landed; the next flush sends it again
+        _restore_batch(batch)
+        raise
+    except Exception as e:
+        print(f"[ERROR] Flush writes failed: {e}")
+        _restore_batch(batch)
+        return 0
+
+def _restore_batch(batch: dict):
+    """Put a batch back in front of anything buffered since, newer values win"""
+    global _buffered_writes
+    newer, _buffered_writes = _buffered_writes, batch
+    for _id, update in newer.items():
+        _merge_update(_id, update)
+
+async def flush_item(queue_id: str):
+    """Flush first if an item has buffered writes, so a direct write can't be overtaken"""
+    if ObjectId(queue_id) in _buffered_writes:
+        await flush_writes()
+
+async def write_flusher():
+    """Flush every WRITE_BUFFER_FLUSH_MS, or sooner once WRITE_BUFFER_MAX_OPS items are waiting"""
+    while not _flusher_stopping:
+        try:
+            await asyncio.wait_for(_flush_now.wait(), timeout=config.WRITE_BUFFER_FLUSH_MS / 1000)
+        except asyncio.TimeoutError:
+            pass
+        _flush_now.clear()
+        await flush_writes()
+
+def start_write_flusher():
+    global _flush_now, _flusher_task, _flusher_stopping
+    if config.WRITE_BUFFER_FLUSH_MS > 0 and _flusher_task is None:
+        _flusher_stopping = False
+        _flush_now = asyncio.Event()
+        _flusher_task = asyncio.create_task(write_flusher())
+
+async def stop_write_flusher():
+    """Stop buffering and write out everything still waiting"""
+    global _flusher_task, _flusher_stopping
+    if _flusher_task:
+        # Not cancelled: a flush cut off mid-way could lose the batch it was sending
+        _flusher_stopping = True
+        _flush_now.set()
+        await _flusher_task
+        _flusher_task = None
+    await flush_writes()
+
+async def ping_db() -> float:
+    """Ping MongoDB, returns latency in ms (raises if unreachable)"""
+    if db is None:
+        raise Exception("Not connected")
+    started = time.monotonic()
+    await db.command('ping')
+    return (time.monotonic() - started) * 1000
+
 def get_db():
     """Get database instance"""
     return db
 
 # ==================== QUEUE OPERATIONS ====================
 
+def build_queue_item(
+    message_id: int,
+    file_name: str,
+    file_id: Optional[str] = None,
+    file_unique_id: Optional[str] = None,
+    file_url: Optional[str] = None,
+    file_size: Optional[int] = None,
+    title: Optional[str] = None,
+    description: Optional[str] = None,
+    thumbnail_file_id: Optional[str] = None,
+    priority: int = 0,
+    chat_id: Optional[int] = None,
+    source_chat_id: Optional[int] = None,
+    preflight: Optional[dict] = None
+) -> dict:
+    """Build a new upload queue document"""
+    return {
+        "message_id": message_id,
+        "source_chat_id": source_chat_id,  # Channel the video was posted in
+        "file_id": file_id,
+        "file_unique_id": file_unique_id,
+        "file_url": file_url,
+        "file_name": file_name,
+        "file_size": file_size,
+        "preflight": preflight,  # URL probe: content type, Range support, final URL
+        "title": title or file_name,
+        "description": description,
+        "thumbnail_file_id": thumbnail_file_id,
+        "status": "pending",
+        "priority": priority,
+        "chat_id": chat_id,  # Where progress updates are sent
+        "lulustream_file_code": None,
+        "lulustream_url": None,
+        "lulustream_account": None,  # Account the file was uploaded with
+        "original_title": None,  # Will be filled after upload from LuluStream
+        "thumbnail_url": None,   # Will be filled after upload from LuluStream
+        "added_at": datetime.utcnow(),
+        "uploaded_at": None,
+        "posted_at": None,
+        "posts": {},  # Channel name -> {"message_id", "posted_at"} once posted there
+        "retry_count": 0,
+        "error_message": None
+    }
+
 async def add_to_queue(
     message_id: int,
     file_name: str,
     file_id: Optional[str] = None,
+    file_unique_id: Optional[str] = None,
     file_url: Optional[str] = None,
     file_size: Optional[int] = None,
     title: Optional[str] = None,
     description: Optional[str] = None,
-    thumbnail_file_id: Optional[str] = None
+    thumbnail_file_id: Optional[str] = None,
+    priority: int = 0,
+    chat_id: Optional[int] = None,
+    preflight: Optional[dict] = None
 ) -> Optional[str]:
     """Add a new video to upload queue"""
     try:
-        queue_item = {
-            "message_id": message_id,
-            "file_id": file_id,
-            "file_url": file_url,
-            "file_name": file_name,
-            "file_size": file_size,
-            "title": title or file_name,
-            "description": description,
-            "thumbnail_file_id": thumbnail_file_id,
-            "status": "pending",
-            "lulustream_file_code": None,
-            "lulustream_url": None,
-            "original_title": None,  # Will be filled after upload from LuluStream
-            "thumbnail_url": None,   # Will be filled after upload from LuluStream
-            "added_at": datetime.utcnow(),
-            "uploaded_at": None,
-            "posted_at": None,
-            "retry_count": 0,
-            "error_message": None
-        }
+        queue_item = build_queue_item(
+            message_id,
+            file_name,
+            file_id=file_id,
+            file_unique_id=file_unique_id,
+            file_url=file_url,
+            file_size=file_size,
+            title=title,
+            description=description,
+            thumbnail_file_id=thumbnail_file_id,
+            priority=priority,
+            chat_id=chat_id,
+            preflight=preflight
+        )
         
         result = await db.upload_queue.insert_one(queue_item)
         return str(result.inserted_id)
@@ -82,11 +270,188 @@ async def add_to_queue(
         print(f"[ERROR] Add to queue failed: {e}")
         return None
 
-async def get_pending_uploads(limit: Optional[int] = None) -> List:
-    """Get pending videos to upload"""
+async def find_existing_unique_ids(file_unique_ids: List[str]) -> set:
+    """
+    file_unique_ids already queued or archived (failed items may be queued again)
+    Errors are raised, callers must not queue duplicates because the check failed.
+    """
+    query = {"file_unique_id": {"$in": file_unique_ids}, "status": {"$ne": "failed"}}
+    found = set()
+    for collection in (db.upload_queue, db.upload_archive):
+        async for item in collection.find(query, {"file_unique_id": 1}):
+            found.add(item["file_unique_id"])
+    return found
+
+async def add_channel_videos(items: List[dict]) -> int:
+    """
+    Queue videos from a channel in one round trip
+    Keyed on (message_id, source_chat_id), and videos whose file_unique_id is
+    already queued or archived are left out, so re-running over the same
+    messages inserts nothing new. Returns how many were newly queued.
+    """
+    try:
+        # Same file forwarded earlier, queued under another message, or already archived
+        existing = await find_existing_unique_ids(
+            [item["file_unique_id"] for item in items if item.get("file_unique_id")]
+        )
+        fresh = []
+        for item in items:
+            unique_id = item.get("file_unique_id")
+            if unique_id:
+                if unique_id in existing:
+                    continue
+                existing.add(unique_id)
+            fresh.append(item)
+        
+        if not fresh:
+            return 0
+        
+        requests = [
+            UpdateOne(
+                {"message_id": item["message_id"], "source_chat_id": item["source_chat_id"]},
+                {"$setOnInsert": item},
+                upsert=True
+            )
+            for item in fresh
+        ]
+        result = await db.upload_queue.bulk_write(requests, ordered=False)
+        return result.upserted_count
+    except Exception as e:
+        print(f"[ERROR] Add channel videos failed: {e}")
+        return 0
+
+# ==================== CLAIM POLICIES ====================
+
+QUEUE_POLICIES = {
+    "fifo": [("added_at", 1)],
+    "priority": [("priority", -1), ("added_at", 1)],
+    "smallest": [("file_size", 1), ("added_at", 1)],
+}
+
+def get_queue_sort(policy: Optional[str] = None) -> list:
+    """Get sort order for the configured claim policy"""
+    return QUEUE_POLICIES.get(policy or config.QUEUE_POLICY, QUEUE_POLICIES["fifo"])
+
+def get_claim_queries() -> list:
+    """Queries for claimable items, tried in order"""
+    # Items with unknown size go after all known sizes when smallest-first
+    if config.QUEUE_POLICY == "smallest":
+        return [
+            {"status": "pending", "file_size": {"$type": "number"}},
+            {"status": "pending"}
+        ]
+    return [{"status": "pending"}]
+
+async def claim_uploads(worker_id: str, count: int) -> List:
+    """
+    Take up to `count` pending videos in claim policy order, in one batch
+    Three round trips however many are claimed: pick IDs, claim those still
+    pending, read them back. Items another worker took in between are skipped.
+    """
+    try:
+        ids = []
+        for query in get_claim_queries():
+            if len(ids) >= count:
+                break
+            cursor = db.upload_queue.find(
+                {**query, "_id": {"$nin": ids}}, {"_id": 1}
+            ).sort(get_queue_sort()).limit(count - len(ids))
+            ids += [item["_id"] async for item in cursor]
+        
+        if not ids:
+            return []
+        
+        token = ObjectId()
+        await db.upload_queue.update_many(
+            {"_id": {"$in": ids}, "status": "pending"},
+            {"$set": {"status": "uploading", "claimed_at": datetime.utcnow(), "worker_id": worker_id, "claim_token": token}}
+        )
+        items = await db.upload_queue.find({"_id": {"$in": ids}, "claim_token": token}).to_list(length=count)
+        
+        order = {_id: i for i, _id in enumerate(ids)}
+        items.sort(key=lambda item: order[item["_id"]])
+        return items
+    except Exception as e:
+        print(f"[ERROR] Claim uploads failed: {e}")
+        return []
+
+async def release_claims(queue_ids: List[str], worker_id: str) -> int:
+    """Hand claimed items that were never started back to pending"""
+    try:
+        result = await db.upload_queue.update_many(
+            {"_id": {"$in": [ObjectId(queue_id) for queue_id in queue_ids]}, "status": "uploading", "worker_id": worker_id},
+            {"$set": {"status": "pending", "worker_id": None}}
+        )
+        return result.modified_count
+    except Exception as e:
+        print(f"[ERROR] Release claims failed: {e}")
+        return 0
+
+# Fields shown by /queue
+QUEUE_PAGE_FIELDS = {"file_name": 1, "status": 1, "added_at": 1, "priority": 1, "file_size": 1}
+
+async def get_queue_page(
+    status: Optional[str] = None,
+    after: Optional[tuple] = None,
+    before: Optional[tuple] = None,
+    limit: int = 10,
+    projection: Optional[dict] = None
+) -> List:
+    """
+    Get one page of the queue ordered by (added_at, _id)
+    after/before are (added_at, _id) keyset cursors, so every page is an index range scan.
+    Returns up to limit + 1 items, the extra one only tells there is another page.
+    """
+    try:
+        query = {"status": status} if status else {}
+        direction = 1
+        
+        if after:
+            added_at, item_id = after
+            query["$or"] = [
+                {"added_at": {"$gt": added_at}},
+                {"added_at": added_at, "_id": {"$gt": item_id}}
+            ]
+        elif before:
+            added_at, item_id = before
+            query["$or"] = [
+                {"added_at": {"$lt": added_at}},
+                {"added_at": added_at, "_id": {"$lt": item_id}}
+            ]
+            direction = -1
+        
+        cursor = db.upload_queue.find(query, projection or QUEUE_PAGE_FIELDS).sort(
+            [("added_at", direction), ("_id", direction)]
+        ).limit(limit + 1)
+        
+        items = await cursor.to_list(length=limit + 1)
+        
+        # Walking backwards, flip the page back into display order
+        if direction == -1:
+            items.reverse()
+        
+        return items
+    except Exception as e:
+        print(f"[ERROR] Get queue page failed: {e}")
+        return []
+
+async def set_priority(queue_id: str, priority: int) -> bool:
+    """Change the priority of a queue item"""
+    try:
+        result = await db.upload_queue.update_one(
+            {"_id": ObjectId(queue_id)},
+            {"$set": {"priority": priority}}
+        )
+        return result.matched_count > 0
+    except Exception as e:
+        print(f"[ERROR] Set priority failed: {e}")
+        return False
+
+async def get_pending_uploads(limit: Optional[int] = None, projection: Optional[dict] = None) -> List:
+    """Get pending videos to upload, in claim order"""
     try:
         query = {"status": "pending"}
-        cursor = db.upload_queue.find(query).sort("added_at", 1)
+        cursor = db.upload_queue.find(query, projection).sort(get_queue_sort())
         
         if limit:
             cursor = cursor.limit(limit)
@@ -96,11 +461,13 @@ async def get_pending_uploads(limit: Optional[int] = None) -> List:
         print(f"[ERROR] Get pending uploads failed: {e}")
         return []
 
-async def get_uploaded_not_posted(limit: Optional[int] = None) -> List:
+async def get_uploaded_not_posted(limit: Optional[int] = None, projection: Optional[dict] = None) -> List:
     """Get uploaded videos that haven't been posted yet"""
     try:
+        # Posted marks may still be buffered, don't hand those items out again
+        await flush_writes()
         query = {"status": "uploaded"}
-        cursor = db.upload_queue.find(query).sort("uploaded_at", 1)
+        cursor = db.upload_queue.find(query, projection).sort("uploaded_at", 1)
         
         if limit:
             cursor = cursor.limit(limit)
@@ -110,6 +477,188 @@ async def get_uploaded_not_posted(limit: Optional[int] = None) -> List:
         print(f"[ERROR] Get uploaded not posted failed: {e}")
         return []
 
+# ==================== POSTING CALENDAR ====================
+# Uploaded items get a scheduled_post_at slot, VIDEOS_PER_BATCH items per
+# POST_INTERVAL_MINUTES. The last allocated slot lives in the schedule
+# collection, so the cadence survives restarts and is shared by instances.
+# Items of one batch share a slot, schedule_seq orders them within it.
+
+# Order of the posting calendar
+SCHEDULE_SORT = [("scheduled_post_at", 1), ("schedule_seq", 1)]
+
+async def allocate_post_slot() -> tuple:
+    """Reserve the next free posting slot and sequence number (compare-and-set, safe with several instances)"""
+    interval = timedelta(minutes=config.POST_INTERVAL_MINUTES)
+    
+    while True:
+        now = datetime.utcnow()
+        calendar = await db.schedule.find_one({"_id": "calendar"})
+        
+        if calendar and calendar["used"] < config.VIDEOS_PER_BATCH and calendar["slot"] + interval > now:
+            # Current batch still has room
+            slot, used = calendar["slot"], calendar["used"] + 1
+        elif calendar:
+            # Next batch, or right away if the calendar has been idle for a whole interval
+            slot, used = max(calendar["slot"] + interval, now), 1
+        else:
+            slot, used = now, 1
+        
+        seq = (calendar or {}).get("seq", 0) + 1
+        
+        if calendar:
+            result = await db.schedule.update_one(
+                {"_id": "calendar", "slot": calendar["slot"], "used": calendar["used"]},
+                {"$set": {"slot": slot, "used": used, "seq": seq}}
+            )
+            if result.modified_count:
+                return slot, seq
+        else:
+            try:
+                await db.schedule.insert_one({"_id": "calendar", "slot": slot, "used": used, "seq": seq})
+                return slot, seq
+            except DuplicateKeyError:
+                pass
+        # Another instance allocated in between, read again
+
+async def schedule_uploaded(limit: int = 100) -> int:
+    """Give uploaded items without a slot one, oldest upload first"""
+    try:
+        cursor = db.upload_queue.find(
+            {"status": "uploaded", "scheduled_post_at": None}, {"_id": 1}
+        ).sort("uploaded_at", 1).limit(limit)
+        
+        scheduled = 0
+        async for item in cursor:
+            slot, seq = await allocate_post_slot()
+            result = await db.upload_queue.update_one(
+                {"_id": item["_id"], "scheduled_post_at": None},
+                {"$set": {"scheduled_post_at": slot, "schedule_seq": seq}}
+            )
+            scheduled += result.modified_count
+        return scheduled
+    except Exception as e:
+        print(f"[ERROR] Schedule uploaded failed: {e}")
+        return 0
+
+async def claim_due_post(holder: str, lease_seconds: int = 300, due_only: bool = True) -> Optional[dict]:
+    """
+    Take the earliest due item for posting
+    The lease stops other instances from posting it too, and runs out on its
+    own if this one dies before marking it posted.
+    """
+    try:
+        now = datetime.utcnow()
+        query = {
+            "status": "uploaded",
+            "scheduled_post_at": {"$lte": now} if due_only else {"$ne": None},
+            "$or": [{"posting_until": None}, {"posting_until": {"$lte": now}}]
+        }
+        return await db.upload_queue.find_one_and_update(
+            query,
+            {"$set": {"posting_until": now + timedelta(seconds=lease_seconds), "posting_by": holder}},
+            sort=SCHEDULE_SORT,
+            return_document=ReturnDocument.AFTER
+        )
+    except Exception as e:
+        print(f"[ERROR] Claim due post failed: {e}")
+        return None
+
+async def release_post(queue_id: str, retry_at: datetime) -> bool:
+    """Give a claimed item back after a failed post, to be tried again at retry_at"""
+    try:
+        result = await db.upload_queue.update_one(
+            {"_id": ObjectId(queue_id)},
+            {"$set": {"posting_until": None, "scheduled_post_at": retry_at}}
+        )
+        return result.modified_count > 0
+    except Exception as e:
+        print(f"[ERROR] Release post failed: {e}")
+        return False
+
+async def mark_channel_posted(queue_id: str, channel: str, message_id: Optional[int],
+                              photo_id: Optional[str] = None) -> bool:
+    """
+    Record a post in one channel right away, a retry only goes to the channels left
+    photo_id is the Telegram file ID of the posted thumbnail, reused for later posts.
+    """
+    try:
+        update_data = {f"posts.{channel}": {"message_id": message_id, "posted_at": datetime.utcnow()}}
+        if photo_id:
+            update_data["post_photo_id"] = photo_id
+        result = await db.upload_queue.update_one({"_id": ObjectId(queue_id)}, {"$set": update_data})
+        return result.modified_count > 0
+    except Exception as e:
+        print(f"[ERROR] Mark channel posted failed: {e}")
+        return False
+
+async def next_post_time() -> Optional[datetime]:
+    """Slot time of the next scheduled post, None if nothing is scheduled"""
+    try:
+        item = await db.upload_queue.find_one(
+            {"status": "uploaded", "scheduled_post_at": {"$ne": None}},
+            {"scheduled_post_at": 1},
+            sort=[("scheduled_post_at", 1)]
+        )
+        return item["scheduled_post_at"] if item else None
+    except Exception as e:
+        print(f"[ERROR] Next post time failed: {e}")
+        return None
+
+async def get_schedule(limit: int = 20) -> List:
+    """Upcoming posts in slot order"""
+    try:
+        cursor = db.upload_queue.find(
+            {"status": "uploaded", "scheduled_post_at": {"$ne": None}},
+            {"file_name": 1, "title": 1, "original_title": 1, "scheduled_post_at": 1}
+        ).sort(SCHEDULE_SORT).limit(limit)
+        return await cursor.to_list(length=limit)
+    except Exception as e:
+        print(f"[ERROR] Get schedule failed: {e}")
+        return []
+
+async def move_in_schedule(queue_id: str, position: int) -> bool:
+    """
+    Move an item to a position (1 = next) in the upcoming schedule
+    The (slot, sequence) places stay where they are, the items between shift by one.
+    """
+    try:
+        item_id = ObjectId(queue_id)
+        fields = {"scheduled_post_at": 1, "schedule_seq": 1}
+        item = await db.upload_queue.find_one(
+            {"_id": item_id, "status": "uploaded", "scheduled_post_at": {"$ne": None}}, fields
+        )
+        if not item:
+            return False
+        
+        slot, seq = item["scheduled_post_at"], item.get("schedule_seq")
+        # Everything up to the item or the target position, whichever is later
+        upcoming = await db.upload_queue.find(
+            {"status": "uploaded", "$or": [
+                {"scheduled_post_at": {"$ne": None, "$lt": slot}},
+                {"scheduled_post_at": slot, "schedule_seq": {"$lte": seq}}
+            ]}, fields
+        ).sort(SCHEDULE_SORT).to_list(length=None)
+        if len(upcoming) < position:
+            upcoming += await db.upload_queue.find(
+                {"status": "uploaded", "$or": [
+                    {"scheduled_post_at": {"$gt": slot}},
+                    {"scheduled_post_at": slot, "schedule_seq": {"$gt": seq}}
+                ]}, fields
+            ).sort(SCHEDULE_SORT).limit(position - len(upcoming)).to_list(length=None)
+        
+        places = [(entry["scheduled_post_at"], entry.get("schedule_seq")) for entry in upcoming]
+        order = [entry["_id"] for entry in upcoming if entry["_id"] != item_id]
+        order.insert(min(max(position, 1), len(places)) - 1, item_id)
+        
+        await db.upload_queue.bulk_write([
+            UpdateOne({"_id": _id}, {"$set": {"scheduled_post_at": place_slot, "schedule_seq": place_seq}})
+            for _id, (place_slot, place_seq) in zip(order, places)
+        ], ordered=False)
+        return True
+    except Exception as e:
+        print(f"[ERROR] Move in schedule failed: {e}")
+        return False
+
 async def update_upload_status(
     queue_id: str,
     status: str,
@@ -117,12 +666,19 @@ async def update_upload_status(
     lulustream_url: Optional[str] = None,
     original_title: Optional[str] = None,
     thumbnail_url: Optional[str] = None,
-    error_message: Optional[str] = None
+    error_message: Optional[str] = None,
+    lulustream_account: Optional[str] = None,
+    sha256: Optional[str] = None,
+    verified_size: Optional[int] = None,
+    inc_retry: bool = False,
+    buffered: bool = False
 ) -> bool:
-    """Update upload status"""
+    """
+    Update upload status
+    buffered=True hands the write to the write-behind buffer instead of waiting
+    for Mongo, only use it where losing the write in a crash is harmless.
+    """
     try:
-        from bson import ObjectId
-        
         update_data = {
             "status": status
         }
@@ -139,25 +695,69 @@ async def update_upload_status(
         if thumbnail_url:
             update_data["thumbnail_url"] = thumbnail_url
         
+        if lulustream_account:
+            update_data["lulustream_account"] = lulustream_account
+        
+        if sha256:
+            update_data["sha256"] = sha256
+        
+        if verified_size:
+            update_data["verified_size"] = verified_size
+        
         if error_message:
             update_data["error_message"] = error_message
         
         if status == "uploaded":
             update_data["uploaded_at"] = datetime.utcnow()
         
+        # The temp file is gone after any of these, only checkpoint_upload keeps transfer state
+        if status in ("uploaded", "failed", "pending"):
+            update_data["partial"] = None
+        
         if status == "posted":
             update_data["posted_at"] = datetime.utcnow()
+            update_data["posting_until"] = None
+        
+        inc_data = {"retry_count": 1} if inc_retry else {}
+        
+        if buffered and _flusher_task:
+            buffer_update(queue_id, update_data, inc_data)
+            return True
         
+        await flush_item(queue_id)
+        update = {"$set": update_data}
+        if inc_data:
+            update["$inc"] = inc_data
+        result = await db.upload_queue.update_one({"_id": ObjectId(queue_id)}, update)
+        
+        return result.modified_count > 0
+    except Exception as e:
+        print(f"[ERROR] Update status failed: {e}")
+        return False
+
+async def checkpoint_upload(queue_id: str, partial: dict) -> bool:
+    """Return an interrupted upload to pending with its partial transfer state"""
+    try:
+        await flush_item(queue_id)
+        partial["saved_at"] = datetime.utcnow()
         result = await db.upload_queue.update_one(
             {"_id": ObjectId(queue_id)},
-            {"$set": update_data}
+            {"$set": {"status": "pending", "worker_id": None, "partial": partial}}
         )
-        
         return result.modified_count > 0
     except Exception as e:
-        print(f"[ERROR] Update status failed: {e}")
+        print(f"[ERROR] Checkpoint upload failed: {e}")
         return False
 
+async def get_checkpointed_ids() -> set:
+    """IDs of pending items with a partial transfer saved"""
+    try:
+        cursor = db.upload_queue.find({"status": "pending", "partial.bytes": {"$gt": 0}}, {"_id": 1})
+        return {str(item["_id"]) async for item in cursor}
+    except Exception as e:
+        print(f"[ERROR] Get checkpointed ids failed: {e}")
+        return set()
+
 async def get_queue_stats() -> dict:
     """Get queue statistics"""
     try:
@@ -167,14 +767,17 @@ async def get_queue_stats() -> dict:
         uploaded = await db.upload_queue.count_documents({"status": "uploaded"})
         posted = await db.upload_queue.count_documents({"status": "posted"})
         failed = await db.upload_queue.count_documents({"status": "failed"})
+        # Collection metadata, no scan over the whole history
+        archived = await db.upload_archive.estimated_document_count()
         
         return {
-            "total": total,
+            "total": total + archived,
             "pending": pending,
             "uploading": uploading,
             "uploaded": uploaded,
             "posted": posted,
-            "failed": failed
+            "failed": failed,
+            "archived": archived
         }
     except Exception as e:
         print(f"[ERROR] Get queue stats failed: {e}")
@@ -184,14 +787,13 @@ async def get_queue_stats() -> dict:
             "uploading": 0,
             "uploaded": 0,
             "posted": 0,
-            "failed": 0
+            "failed": 0,
+            "archived": 0
         }
 
 async def increment_retry_count(queue_id: str) -> int:
     """Increment retry count for failed uploads"""
     try:
-        from bson import ObjectId
-        
         result = await db.upload_queue.update_one(
             {"_id": ObjectId(queue_id)},
             {"$inc": {"retry_count": 1}}
@@ -209,7 +811,6 @@ async def increment_retry_count(queue_id: str) -> int:
 async def get_queue_item(queue_id: str) -> Optional[dict]:
     """Get a specific queue item by ID"""
     try:
-        from bson import ObjectId
         return await db.upload_queue.find_one({"_id": ObjectId(queue_id)})
     except Exception as e:
         print(f"[ERROR] Get queue item failed: {e}")
@@ -218,7 +819,6 @@ async def get_queue_item(queue_id: str) -> Optional[dict]:
 async def delete_queue_item(queue_id: str) -> bool:
     """Delete a queue item"""
     try:
-        from bson import ObjectId
         result = await db.upload_queue.delete_one({"_id": ObjectId(queue_id)})
         return result.deleted_count > 0
     except Exception as e:
@@ -234,12 +834,177 @@ async def clear_failed_uploads() -> int:
         print(f"[ERROR] Clear failed uploads failed: {e}")
         return 0
 
-async def get_recent_posts(limit: int = 10) -> List:
-    """Get recently posted videos"""
+async def get_recent_posts(limit: int = 10, projection: Optional[dict] = None) -> List:
+    """Get recently posted videos (from the queue and the archive)"""
     try:
         query = {"status": "posted"}
-        cursor = db.upload_queue.find(query).sort("posted_at", -1).limit(limit)
-        return await cursor.to_list(length=limit)
+        posts = []
+        
+        for collection in (db.upload_queue, db.upload_archive):
+            cursor = collection.find(query, projection).sort("posted_at", -1).limit(limit)
+            posts += await cursor.to_list(length=limit)
+        
+        posts.sort(key=lambda item: item.get("posted_at") or datetime.min, reverse=True)
+        return posts[:limit]
     except Exception as e:
         print(f"[ERROR] Get recent posts failed: {e}")
         return []
+
+async def find_existing_item(file_url: Optional[str] = None, file_unique_id: Optional[str] = None) -> Optional[dict]:
+    """Find a video that was already queued, in the queue or the archive"""
+    try:
+        if file_unique_id:
+            query = {"file_unique_id": file_unique_id}
+        elif file_url:
+            query = {"file_url": file_url}
+        else:
+            return None
+        
+        # Failed items may be queued again
+        query["status"] = {"$ne": "failed"}
+        
+        for collection in (db.upload_queue, db.upload_archive):
+            item = await collection.find_one(query, {"status": 1, "file_name": 1})
+            if item:
+                return item
+        
+        return None
+    except Exception as e:
+        print(f"[ERROR] Find existing item failed: {e}")
+        return None
+
+# ==================== RECONCILIATION ====================
+
+async def mark_upload_attempt(queue_id: str, attempt: Optional[dict]):
+    """Remember which account and title an upload went to, None once its outcome is known"""
+    if _flusher_task:
+        buffer_update(queue_id, {"upload_attempt": attempt})
+        return
+    try:
+        await db.upload_queue.update_one({"_id": ObjectId(queue_id)}, {"$set": {"upload_attempt": attempt}})
+    except Exception as e:
+        print(f"[ERROR] Mark upload attempt failed: {e}")
+
+async def get_interrupted_uploads(limit: int = 200) -> List:
+    """Pending or failed items whose upload was started before, oldest attempt first"""
+    try:
+        cursor = db.upload_queue.find(
+            {"status": {"$in": ["pending", "failed"]}, "upload_attempt": {"$ne": None}},
+            {"file_name": 1, "upload_attempt": 1, "status": 1}
+        ).sort("upload_attempt.started_at", 1).limit(limit)
+        return await cursor.to_list(length=limit)
+    except Exception as e:
+        print(f"[ERROR] Get interrupted uploads failed: {e}")
+        return []
+
+async def is_file_code_used(file_code: str) -> bool:
+    """Check if a LuluStream file already belongs to a queue item"""
+    try:
+        for collection in (db.upload_queue, db.upload_archive):
+            if await collection.find_one({"lulustream_file_code": file_code}, {"_id": 1}):
+                return True
+        return False
+    except Exception as e:
+        print(f"[ERROR] File code lookup failed: {e}")
+        return True  # Unknown counts as used, never attach a file twice
+
+async def mark_reconciled(queue_id: str, fields: dict, from_statuses: tuple = ("pending", "failed")) -> bool:
+    """Mark an item uploaded with a file found on LuluStream, if nobody else has taken it meanwhile"""
+    try:
+        await flush_item(queue_id)
+        now = datetime.utcnow()
+        result = await db.upload_queue.update_one(
+            {"_id": ObjectId(queue_id), "status": {"$in": list(from_statuses)}},
+            {"$set": {**fields, "status": "uploaded", "uploaded_at": now, "reconciled_at": now,
+                      "partial": None, "worker_id": None}}
+        )
+        return result.modified_count > 0
+    except Exception as e:
+        print(f"[ERROR] Mark reconciled failed: {e}")
+        return False
+
+# ==================== ARCHIVE ====================
+
+async def archive_items(batch_size: int = 500) -> int:
+    """Move posted and old failed items out of upload_queue into upload_archive"""
+    try:
+        now = datetime.utcnow()
+        query = {"$or": [
+            {"status": "posted", "posted_at": {"$lt": now - timedelta(hours=config.ARCHIVE_POSTED_AFTER_HOURS)}},
+            {"status": "failed", "added_at": {"$lt": now - timedelta(days=config.ARCHIVE_FAILED_AFTER_DAYS)}}
+        ]}
+        moved = 0
+        
+        while True:
+            items = await db.upload_queue.find(query).limit(batch_size).to_list(length=batch_size)
+            if not items:
+                break
+            
+            for item in items:
+                item["archived_at"] = now
+            
+            # Copy first, then delete: a crash in between leaves duplicates that the next run skips
+            try:
+                await db.upload_archive.insert_many(items, ordered=False)
+            except BulkWriteError as e:
+                if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                    raise
+            
+            result = await db.upload_queue.delete_many({"_id": {"$in": [item["_id"] for item in items]}})
+            moved += result.deleted_count
+        
+        return moved
+    except Exception as e:
+        print(f"[ERROR] Archive items failed: {e}")
+        return 0
+
+# ==================== WORKER REGISTRY ====================
+
+async def register_worker(worker_id: str, info: dict) -> bool:
+    """Register a worker or refresh its heartbeat"""
+    try:
+        now = datetime.utcnow()
+        await db.workers.update_one(
+            {"_id": worker_id},
+            {"$set": {**info, "last_seen": now}, "$setOnInsert": {"started_at": now}},
+            upsert=True
+        )
+        return True
+    except Exception as e:
+        print(f"[ERROR] Register worker failed: {e}")
+        return False
+
+async def unregister_worker(worker_id: str) -> bool:
+    """Remove a worker from the registry"""
+    try:
+        result = await db.workers.delete_one({"_id": worker_id})
+        return result.deleted_count > 0
+    except Exception as e:
+        print(f"[ERROR] Unregister worker failed: {e}")
+        return False
+
+async def get_live_workers() -> List:
+    """Get workers with a recent heartbeat"""
+    try:
+        cutoff = datetime.utcnow() - timedelta(seconds=config.WORKER_TIMEOUT_SECONDS)
+        cursor = db.workers.find({"last_seen": {"$gte": cutoff}}).sort("started_at", 1)
+        return await cursor.to_list(length=100)
+    except Exception as e:
+        print(f"[ERROR] Get live workers failed: {e}")
+        return []
+
+async def requeue_orphaned_uploads() -> int:
+    """Return uploads claimed by workers that are no longer alive to pending"""
+    try:
+        # Every live worker, uncapped; if this read fails nothing is requeued, an empty
+        # list would take items from workers that are still transferring them
+        cutoff = datetime.utcnow() - timedelta(seconds=config.WORKER_TIMEOUT_SECONDS)
+        live_worker_ids = await db.workers.distinct("_id", {"last_seen": {"$gte": cutoff}})
+        result = await db.upload_queue.update_many(
+            {"status": "uploading", "worker_id": {"$nin": live_worker_ids}},
+            {"$set": {"status": "pending", "worker_id": None}}
+        )
+        return result.modified_count
+    except Exception as e:
+        print(f"[ERROR] Requeue orphaned uploads failed: {e}")
+        return 0
@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# ==================== LOOP LAG ====================
+
+class LoopMonitor:
+    """Detect event-loop stalls and capture the stack of whatever is blocking it
+
+    A task on the loop ticks every `interval` seconds. A watchdog thread checks
+    the last tick; once it is older than the threshold, the loop thread's
+    current stack is the blocking callback, so it is logged and kept.
+    """
+
+    def __init__(self, threshold_ms: int, interval: float = 0.1, keep: int = 10):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval
+        self.stalls = deque(maxlen=keep)  # {"at", "lag_ms", "stack"}
+
+        self.lag_ms = 0
+        self.max_lag_ms = 0
+        self.last_tick = time.monotonic()
+        self.loop_thread_id = None
+        self._task = None
+        self._stalled = None  # Stall being reported, duration filled in once the loop is back
+
+    def start(self):
+        """Start monitoring the running loop"""
+        if self._task or self.threshold <= 0:
+            return
+        self.loop_thread_id = threading.get_ident()
+        self.last_tick = time.monotonic()
+        self._task = asyncio.create_task(self._tick())
+        threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+        logger.info(f"[DIAG] Loop lag monitor started, threshold {int(self.threshold * 1000)}ms")
+
+    async def _tick(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+
+            self.lag_ms = int(max(0.0, now - expected) * 1000)
+            self.max_lag_ms = max(self.max_lag_ms, self.lag_ms)
+            self.last_tick = now
+
+            stall = self._stalled
+            if stall:
+                self._stalled = None
+                stall["lag_ms"] = self.lag_ms
+                logger.warning(f"[DIAG] Event loop was blocked for {self.lag_ms}ms")
+
+    def _watch(self):
+        while True:
+            time.sleep(self.interval)
+            if self._stalled or time.monotonic() - self.last_tick < self.threshold:
+                continue
+
+            frame = sys._current_frames().get(self.loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "(no stack)"
+            stall = {"at": time.time(), "lag_ms": None, "stack": stack}
+            self.stalls.append(stall)
+            self._stalled = stall
+            logger.warning(f"[DIAG] Event loop blocked over {int(self.threshold * 1000)}ms in:\n{stack}")
+
+    def summary(self) -> str:
+        return f"lag {self.lag_ms}ms, max {self.max_lag_ms}ms, {len(self.stalls)} stalls"
+
+loop_monitor = LoopMonitor(config.LOOP_LAG_THRESHOLD_MS)
+
+# ==================== SAMPLING PROFILER ====================
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{frame.f_lineno} {code.co_name}"
+
+def sample_profile(seconds: float, interval: float = 0.01, top: int = 30) -> str:
+    """
+    Sample every thread's stack for `seconds` and report the hottest lines
+    Runs in its own thread, the profiled code keeps running untouched.
+    """
+    own = threading.get_ident()
+    names = {t.ident: t.name for t in threading.enumerate()}
+    self_counts = Counter()    # Innermost frame: where time is actually spent
+    total_counts = Counter()   # Anywhere on the stack: what it was called from
+    samples = 0
+
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            thread = names.get(thread_id, str(thread_id))
+            self_counts[(thread, _frame_label(frame))] += 1
+
+            seen = set()
+            while frame is not None:
+                label = _frame_label(frame)
+                if label not in seen:
+                    seen.add(label)
+                    total_counts[(thread, label)] += 1
+                frame = frame.f_back
+        samples += 1
+        time.sleep(interval)
+
+    def table(counts: Counter) -> list:
+        return [
+            f"{count * 100 / samples:6.1f}%  [{thread}] {label}"
+            for (thread, label), count in counts.most_common(top)
+        ]
+
+    lines = [f"Sampled {samples} times over {seconds:.0f}s ({int(interval * 1000)}ms interval)", ""]
+    lines += ["== Self (innermost frame) =="] + table(self_counts) + [""]
+    lines += ["== Total (anywhere on stack) =="] + table(total_counts)
+    return "\n".join(lines)
@@ -0,0 +1,149 @@
+import hashlib
+import logging
+import os
+import struct
+import sys
+import time
+from typing import Optional
+
+import config
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+COPY_CHUNK = 4 * MB
+
+# Boxes on the way from moov down to the chunk offset tables
+CONTAINERS = {b"moov", b"trak", b"mdia", b"minf", b"stbl"}
+
+class Unsupported(Exception):
+    """The file is left as it is: already fast, fragmented, or a layout we don't rewrite"""
+
+def read_boxes(f, start: int, end: int) -> list:
+    """Top-level (type, start, size) boxes between start and end"""
+    boxes = []
+    offset = start
+    while offset + 8 <= end:
+        f.seek(offset)
+        size, box_type = struct.unpack(">I4s", f.read(8))
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+        elif size == 0:
+            size = end - offset  # Runs to the end of the file
+        if size < 8 or offset + size > end:
+            raise Unsupported(f"Broken {box_type!r} box at {offset}")
+        boxes.append((box_type, offset, size))
+        offset += size
+    return boxes
+
+def patch_offsets(moov: bytearray, start: int, end: int, shift):
+    """Rewrite every stco/co64 entry inside moov[start:end] with shift(offset)"""
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", moov, offset)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", moov, offset + 8)[0]
+            header = 16
+        if size < header or offset + size > end:
+            raise Unsupported(f"Broken {box_type!r} box in moov")
+
+        if box_type in CONTAINERS:
+            patch_offsets(moov, offset + header, offset + size, shift)
+        elif box_type in (b"stco", b"co64"):
+            fmt = ">I" if box_type == b"stco" else ">Q"
+            width = struct.calcsize(fmt)
+            # Full box: version/flags, entry count, then the offsets
+            count = struct.unpack_from(">I", moov, offset + header + 4)[0]
+            table = offset + header + 8
+            for i in range(count):
+                position = table + i * width
+                new = shift(struct.unpack_from(fmt, moov, position)[0])
+                if box_type == b"stco" and new > 0xFFFFFFFF:
+                    # Growing stco into co64 would change the file size
+                    raise Unsupported("Chunk offsets pass 4 GB after the move")
+                struct.pack_into(fmt, moov, position, new)
+        elif box_type in (b"cmov", b"saio", b"iloc"):
+            # Compressed headers or more absolute offsets we don't track
+            raise Unsupported(f"Contains {box_type.decode(errors='replace')}")
+
+        offset += size
+
+def copy_range(src, dst, start: int, length: int, digest):
+    src.seek(start)
+    while length > 0:
+        chunk = src.read(min(COPY_CHUNK, length))
+        if not chunk:
+            raise Unsupported("File ended early")
+        dst.write(chunk)
+        digest.update(chunk)
+        length -= len(chunk)
+
+def faststart(file_path: str, max_moov_bytes: int = None) -> Optional[str]:
+    """
+    Move the moov box in front of the media data so playback can start right away
+    Writes a new file in one sequential pass (bounded buffer) and swaps it in, the
+    size stays the same. Returns the new file's sha256, None if nothing was changed.
+    """
+    if max_moov_bytes is None:
+        max_moov_bytes = config.FASTSTART_MAX_MOOV_MB * MB
+    out_path = f"{file_path}.faststart"
+
+    try:
+        with open(file_path, "rb") as src:
+            file_size = os.fstat(src.fileno()).st_size
+            boxes = read_boxes(src, 0, file_size)
+            types = [box_type for box_type, _, _ in boxes]
+
+            if b"moof" in types:
+                raise Unsupported("Fragmented MP4")
+            if b"moov" not in types or b"mdat" not in types:
+                raise Unsupported("No moov or mdat box")
+
+            _, moov_start, moov_size = boxes[types.index(b"moov")]
+            _, insert_at, _ = boxes[types.index(b"mdat")]
+            if moov_start < insert_at:
+                return None  # Already faststart
+            if moov_size > max_moov_bytes:
+                raise Unsupported(f"moov is {moov_size // MB} MB")
+
+            src.seek(moov_start)
+            moov = bytearray(src.read(moov_size))
+
+            # Media between the first mdat and the old moov moves down by the moov's size,
+            # everything after the old moov stays where it was
+            def shift(offset: int) -> int:
+                if insert_at <= offset < moov_start:
+                    return offset + moov_size
+                return offset
+
+            patch_offsets(moov, 0, moov_size, shift)
+
+            digest = hashlib.sha256()
+            with open(out_path, "wb") as dst:
+                copy_range(src, dst, 0, insert_at, digest)
+                dst.write(moov)
+                digest.update(moov)
+                copy_range(src, dst, insert_at, moov_start - insert_at, digest)
+                copy_range(src, dst, moov_start + moov_size, file_size - moov_start - moov_size, digest)
+
+        os.replace(out_path, file_path)
+        return digest.hexdigest()
+
+    except Unsupported as e:
+        logger.info(f"[FASTSTART] Skipped {os.path.basename(file_path)}: {e}")
+        return None
+    finally:
+        if os.path.exists(out_path):
+            os.remove(out_path)
+
+if __name__ == "__main__":
+    # python faststart.py video.mp4 - rewrite a file in place and report the cost
+    logging.basicConfig(level=logging.INFO)
+    for path in sys.argv[1:]:
+        size = os.path.getsize(path)
+        started = time.monotonic()
+        sha256 = faststart(path)
+        seconds = time.monotonic() - started
+        print(f"{path}: {size / MB:.0f} MB in {seconds:.1f}s ({size / MB / max(seconds, 0.001):.0f} MB/s)"
+              f" {'moved moov' if sha256 else 'unchanged'}")
@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+from urllib.parse import urlparse
+
+import aiohttp
+
+import config
+
+logger = logging.getLogger(__name__)
+
+class HostStats:
+    """Counters for one source host, used to tune its connection cap"""
+    __slots__ = ("limit", "active", "peak", "requests", "errors", "bytes", "seconds", "wait_seconds")
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self.peak = 0
+        self.requests = 0
+        self.errors = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.wait_seconds = 0.0  # Time spent queued behind the cap
+
+class SourcePool:
+    """One pooled aiohttp session for all source downloads, with a connection cap per host
+
+    Keep-alive connections and resolved addresses are reused across items,
+    and no single CDN sees more than its cap of parallel connections.
+    """
+
+    def __init__(self, per_host: int, host_limits: dict = None, max_connections: int = 100,
+                 dns_cache_seconds: int = 300, timeout: aiohttp.ClientTimeout = None):
+        self.per_host = max(1, per_host)
+        self.host_limits = host_limits or {}
+        self.max_connections = max_connections
+        self.dns_cache_seconds = dns_cache_seconds
+        self.timeout = timeout or aiohttp.ClientTimeout()
+
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.hosts = {}  # host -> (Semaphore, HostStats)
+        self.probe_slots = {}  # host -> Semaphore for short checks, apart from downloads
+
+    def get_session(self) -> aiohttp.ClientSession:
+        """Create the session on first use, inside the running event loop"""
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                ttl_dns_cache=self.dns_cache_seconds,
+                enable_cleanup_closed=True
+            )
+            # Ask for the file as stored: aiohttp offers gzip/deflate by default, and with
+            # auto_decompress off a compressed body would be written into the video as is
+            self.session = aiohttp.ClientSession(
+                connector=connector, timeout=self.timeout, auto_decompress=False,
+                headers={"Accept-Encoding": "identity"}
+            )
+        return self.session
+
+    def _host(self, host: str):
+        if host not in self.hosts:
+            limit = int(self.host_limits.get(host, self.per_host))
+            self.hosts[host] = (asyncio.Semaphore(limit), HostStats(limit))
+        return self.hosts[host]
+
+    @asynccontextmanager
+    async def request(self, method: str, url: str, probe: bool = False, **kwargs):
+        """Send a request once the host has a free slot, the slot is held until the body is read
+
+        probe=True is for short checks (HEAD, one byte): they have their own allowance
+        per host and never queue behind a running download.
+        """
+        host = urlparse(url).hostname or ""
+        semaphore, stats = self._host(host)
+        if probe:
+            semaphore = self.probe_slots.setdefault(host, asyncio.Semaphore(stats.limit))
+
+        queued_at = time.monotonic()
+        async with semaphore:
+            started_at = time.monotonic()
+            stats.requests += 1
+            if not probe:
+                # Download slots only, these are what the cap is tuned on
+                stats.wait_seconds += started_at - queued_at
+                stats.active += 1
+                stats.peak = max(stats.peak, stats.active)
+
+            response = None
+            try:
+                async with self.get_session().request(method, url, **kwargs) as response:
+                    yield response
+            except Exception:
+                stats.errors += 1
+                raise
+            finally:
+                if not probe:
+                    stats.active -= 1
+                stats.seconds += time.monotonic() - started_at
+                if response is not None:
+                    stats.bytes += response.content.total_bytes
+
+    def stats(self) -> list:
+        """Per-host counters, busiest hosts first"""
+        rows = [
+            {
+                "host": host,
+                "limit": s.limit,
+                "active": s.active,
+                "peak": s.peak,
+                "requests": s.requests,
+                "errors": s.errors,
+                "bytes": s.bytes,
+                "seconds": round(s.seconds, 1),
+                "wait_seconds": round(s.wait_seconds, 1)
+            }
+            for host, (_, s) in self.hosts.items()
+        ]
+        return sorted(rows, key=lambda row: row["bytes"], reverse=True)
+
+    async def close(self):
+        if self.session and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+_pool = None
+
+def get_pool() -> SourcePool:
+    """Get the process-wide source download pool"""
+    global _pool
+    if _pool is None:
+        _pool = SourcePool(
+            per_host=config.HTTP_PER_HOST_LIMIT,
+            host_limits=config.HTTP_HOST_LIMITS,
+            max_connections=config.HTTP_MAX_CONNECTIONS,
+            dns_cache_seconds=config.HTTP_DNS_CACHE_SECONDS,
+            timeout=aiohttp.ClientTimeout(
+                total=config.HTTP_TOTAL_TIMEOUT or None,
+                connect=config.HTTP_CONNECT_TIMEOUT or None,
+                sock_read=config.HTTP_READ_TIMEOUT or None
+            )
+        )
+    return _pool
@@ -0,0 +1,77 @@
+import atexit
+import logging
+import queue
+import re
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+import config
+
+# key=... in URLs, query strings and form dumps
+KEY_PARAM = re.compile(r"(\bkey=)[^&\s'\"]+")
+
+def _secrets() -> list:
+    """API keys and tokens that must never reach the logs, longest first"""
+    secrets = [config.LULUSTREAM_API_KEY, config.BOT_TOKEN, config.WEBHOOK_SECRET]
+    secrets += [entry.get("key") for entry in config.LULUSTREAM_ACCOUNTS]
+    return sorted({s for s in secrets if s and len(s) >= 8}, key=len, reverse=True)
+
+SECRETS = _secrets()
+
+def redact(text: str) -> str:
+    """Mask API keys and tokens in a log message"""
+    text = KEY_PARAM.sub(r"\1***", text)
+    for secret in SECRETS:
+        if secret in text:
+            text = text.replace(secret, "***")
+    return text
+
+def truncate(text, limit: int = 300) -> str:
+    """Shorten response bodies so one log line stays small"""
+    text = str(text)
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}... ({len(text)} chars)"
+
+class RedactingQueueHandler(QueueHandler):
+    """Hand records to the listener thread, redacted and already formatted"""
+
+    def prepare(self, record):
+        record = super().prepare(record)
+        record.msg = redact(record.msg)
+        fields = getattr(record, "fields", None)
+        if fields:
+            record.fields = {k: redact(str(v)) for k, v in fields.items()}
+        return record
+
+class StructuredFormatter(logging.Formatter):
+    """Standard log line, followed by key=value pairs passed as extra={"fields": {...}}"""
+
+    def format(self, record):
+        line = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        return line
+
+def setup_logging(level: str = "INFO"):
+    """
+    Send all logging through a queue to a background thread
+    Callers (the event loop, upload threads) only put a record on the queue,
+    formatting and writing to stdout never block them.
+    """
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(StructuredFormatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    root.handlers = [RedactingQueueHandler(log_queue)]
+    root.setLevel(getattr(logging, str(level).upper(), logging.INFO))
+
+    # Request logs repeat every URL, including the API key in query strings
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    logging.getLogger("urllib3").setLevel(logging.WARNING)
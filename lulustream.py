@@ -1,61 +1,225 @@
 import requests
 import config
+import logging
 import os
 import tempfile
-from typing import Optional, Dict
-from urllib.parse import urlencode
+import time
+import uuid
+from typing import Optional, Dict, Callable
+from urllib.parse import urlencode, urlparse
+from circuit import CircuitBreaker, ProviderUnavailable
+from logs import redact, truncate
+
+logger = logging.getLogger(__name__)
+
+# Shared by all accounts, an outage hits every account at once
+provider_breaker = CircuitBreaker(
+    "lulustream",
+    error_threshold=config.CIRCUIT_ERROR_THRESHOLD,
+    min_calls=config.CIRCUIT_MIN_CALLS,
+    window=config.CIRCUIT_WINDOW,
+    reset_seconds=config.CIRCUIT_RESET_SECONDS,
+    half_open_calls=config.CIRCUIT_HALF_OPEN_CALLS
+)
+
+# Error text LuluStream returns when an account is throttled or out of space
+LIMIT_ERROR_MARKERS = (
+    'upload limit reached', 'reached your upload limit', 'reached the upload limit',
+    'daily upload limit', 'daily limit reached', 'quota', 'too many requests',
+    'rate limit', 'not enough disk space', 'storage limit', 'storage is full'
+)
+
+# Rejections of the file itself, never a reason to rest the account
+FILE_ERROR_MARKERS = ('file size', 'max size', 'too large', 'too big', 'file is')
+
+def is_limit_error(status_code: int, text: str) -> bool:
+    """Check if a response means the account hit a quota or rate limit"""
+    if status_code == 429:
+        return True
+    text = (text or '').lower()
+    if any(marker in text for marker in FILE_ERROR_MARKERS):
+        return False
+    return any(marker in text for marker in LIMIT_ERROR_MARKERS)
+
+class MultipartStream:
+    """
+    multipart/form-data body that streams files from disk
+    requests would otherwise build the whole body (the full video) in memory.
+    on_read is called with every chunk of file data sent, e.g. for progress
+    counters and checksums, so form fields and boundaries are not counted.
+    """
+    
+    def __init__(self, fields: Dict, files: Dict, on_read: Callable = None):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+        self.on_read = on_read
+        
+        # Each part is either bytes or a file path streamed at read time
+        self._parts = []
+        for name, value in fields.items():
+            self._parts.append(
+                f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+            )
+        for name, (filename, path, mime) in files.items():
+            self._parts.append(
+                f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                f'Content-Type: {mime}\r\n\r\n'.encode()
+            )
+            self._parts.append(path)
+            self._parts.append(b'\r\n')
+        self._parts.append(f'--{self.boundary}--\r\n'.encode())
+        
+        self._length = sum(
+            len(part) if isinstance(part, bytes) else os.path.getsize(part)
+            for part in self._parts
+        )
+        self._index = 0
+        self._current = None
+    
+    def __len__(self):
+        return self._length
+    
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self._length
+        
+        while self._index < len(self._parts):
+            part = self._parts[self._index]
+            
+            if isinstance(part, bytes):
+                self._index += 1
+                chunk = part
+            else:
+                if self._current is None:
+                    self._current = open(part, 'rb')
+                chunk = self._current.read(size)
+                if not chunk:
+                    self._current.close()
+                    self._current = None
+                    self._index += 1
+                    continue
+                if self.on_read:
+                    self.on_read(chunk)
+            
+            return chunk
+        
+        return b''
+    
+    def close(self):
+        if self._current:
+            self._current.close()
+            self._current = None
 
 class LuluStreamClient:
     """Client for LuluStream API"""
     
-    def __init__(self):
-        self.api_key = config.LULUSTREAM_API_KEY
+    def __init__(self, api_key: str = None, folder_id: int = None, category_id: int = None):
+        self.api_key = api_key or config.LULUSTREAM_API_KEY
+        self.folder_id = folder_id if folder_id is not None else config.FOLDER_ID
+        self.category_id = category_id if category_id is not None else config.CATEGORY_ID
         self.upload_server = config.LULUSTREAM_UPLOAD_SERVER
         self.api_base = config.LULUSTREAM_API_BASE
+        
+        # Cached upload server URL and when it was fetched
+        self._server_url = None
+        self._server_fetched_at = 0.0
     
-    def get_upload_server(self) -> Optional[str]:
+    def _request(self, method: str, url: str, item_timeout: bool = False, **kwargs) -> requests.Response:
+        """
+        Send a request through the circuit breaker
+        Raises ProviderUnavailable on open circuit, network errors and 5xx
+        
+        item_timeout=True blames a timeout on the request itself (e.g. a file too
+        big to send in time): it is not counted against LuluStream and raised as is.
+        """
+        if not provider_breaker.allow():
+            raise ProviderUnavailable(f"LuluStream circuit open, retry in {provider_breaker.retry_after():.0f}s")
+        
+        started = time.monotonic()
+        try:
+            response = requests.request(method, url, **kwargs)
+        except requests.Timeout as e:
+            # Unless the circuit has opened meanwhile, then LuluStream is the problem after all
+            if item_timeout and provider_breaker.state == "closed":
+                raise requests.Timeout(f"LuluStream request timed out: {redact(str(e))}")
+            provider_breaker.record_failure()
+            raise ProviderUnavailable(f"LuluStream request failed: {redact(str(e))}")
+        except requests.RequestException as e:
+            provider_breaker.record_failure()
+            # Exception text contains the request URL, and with it the key
+            raise ProviderUnavailable(f"LuluStream request failed: {redact(str(e))}")
+        
+        logger.debug("[LULUSTREAM] Request done", extra={"fields": {
+            "method": method.upper(),
+            "path": urlparse(url).path,
+            "status": response.status_code,
+            "duration_ms": int((time.monotonic() - started) * 1000)
+        }})
+        
+        if response.status_code >= 500:
+            provider_breaker.record_failure()
+            raise ProviderUnavailable(f"LuluStream server error {response.status_code}")
+        
+        provider_breaker.record_success()
+        return response
+    
+    def get_upload_server(self, fresh: bool = False) -> Optional[str]:
         """
         Get upload server URL
         GET https://lulustream.com/api/upload/server?key={api_key}
+        
+        Cached for UPLOAD_SERVER_CACHE_SECONDS, fresh=True always asks (a cheap health check)
         """
+        if not fresh and self._server_url and time.monotonic() - self._server_fetched_at < config.UPLOAD_SERVER_CACHE_SECONDS:
+            return self._server_url
+        
         try:
             url = f"{self.api_base}/upload/server"
             params = {'key': self.api_key}
             
-            response = requests.get(url, params=params, timeout=30)
+            response = self._request('get', url, params=params, timeout=30)
             if response.status_code == 200:
                 data = response.json()
                 if data.get('msg') == 'OK' and data.get('result'):
-                    return data['result']
+                    self._server_url = data['result']
+                    self._server_fetched_at = time.monotonic()
+                    return self._server_url
             
-            print(f"[ERROR] Failed to get upload server: {response.text}")
+            logger.error("[LULUSTREAM] Failed to get upload server", extra={"fields": {
+                "status": response.status_code, "body": truncate(response.text)
+            }})
             return None
         except Exception as e:
-            print(f"[ERROR] Get upload server error: {e}")
+            logger.error(f"[LULUSTREAM] Get upload server error: {e}")
             return None
     
     def upload_file(self, file_path: str, title: str = None, description: str = None, 
-                   tags: str = None, snapshot_path: str = None) -> Optional[Dict]:
+                   tags: str = None, snapshot_path: str = None,
+                   on_read: Callable = None) -> Optional[Dict]:
         """
         Upload file to LuluStream
         POST https://s1.myvideo.com/upload/01
         
+        The body is streamed from disk, on_read(chunk) sees every chunk of the file sent
+        
         Returns:
             {"filecode": "xxx", "status": "OK"} on success
+            outcome_unknown=True when the request got no answer (timeout, dropped
+            connection, 5xx): the file may still have arrived
         """
         try:
             # Get upload server (optional, use default if fails)
             upload_url = self.get_upload_server() or self.upload_server
             
-            print(f"[LULUSTREAM] Uploading to: {upload_url}")
-            print(f"[LULUSTREAM] File: {file_path}")
-            print(f"[LULUSTREAM] Title: {title}")
+            logger.debug("[LULUSTREAM] Upload starting", extra={"fields": {
+                "server": upload_url, "file": os.path.basename(file_path), "title": title
+            }})
             
             # Prepare form data
             data = {
                 'key': self.api_key,
-                'fld_id': config.FOLDER_ID,
-                'cat_id': config.CATEGORY_ID,
+                'fld_id': self.folder_id,
+                'cat_id': self.category_id,
                 'file_public': config.FILE_PUBLIC,
                 'file_adult': config.FILE_ADULT,
             }
@@ -72,29 +236,36 @@ class LuluStreamClient:
             
             # Prepare files
             files = {
-                'file': (os.path.basename(file_path), open(file_path, 'rb'), 'video/mp4')
+                'file': (os.path.basename(file_path), file_path, 'video/mp4')
             }
             
             # Add snapshot if provided
             if snapshot_path and os.path.exists(snapshot_path):
-                files['snapshot'] = (os.path.basename(snapshot_path), open(snapshot_path, 'rb'), 'image/jpeg')
+                files['snapshot'] = (os.path.basename(snapshot_path), snapshot_path, 'image/jpeg')
             
-            # Upload with longer timeout for large files
-            print(f"[LULUSTREAM] Starting upload...")
-            response = requests.post(
-                upload_url,
-                data=data,
-                files=files,
-                timeout=7200  # 2 hour timeout for large files
-            )
+            body = MultipartStream(data, files, on_read=on_read)
             
-            # Close file handles
-            for file_obj in files.values():
-                if hasattr(file_obj[1], 'close'):
-                    file_obj[1].close()
+            # Upload with longer timeout for large files
+            started = time.monotonic()
+            try:
+                response = self._request(
+                    'post',
+                    upload_url,
+                    data=body,
+                    headers={'Content-Type': body.content_type},
+                    timeout=7200,  # 2 hour timeout for large files
+                    # A file that can't be sent in time fails like any bad item and spends a retry
+                    item_timeout=True
+                )
+            finally:
+                # Close file handles
+                body.close()
             
-            print(f"[LULUSTREAM] Response status: {response.status_code}")
-            print(f"[LULUSTREAM] Response: {response.text[:500]}")
+            fields = {
+                "status": response.status_code,
+                "bytes": os.path.getsize(file_path),
+                "duration_ms": int((time.monotonic() - started) * 1000)
+            }
             
             if response.status_code == 200:
                 try:
@@ -102,6 +273,7 @@ class LuluStreamClient:
                     if data.get('status') == 200 and data.get('result'):
                         filecode = data['result'][0].get('filecode')
                         if filecode:
+                            logger.info("[LULUSTREAM] Upload done", extra={"fields": {**fields, "filecode": filecode}})
                             return {
                                 'success': True,
                                 'filecode': filecode,
@@ -110,16 +282,20 @@ class LuluStreamClient:
                 except ValueError:
                     pass
             
+            logger.warning("[LULUSTREAM] Upload rejected", extra={"fields": {**fields, "body": truncate(response.text)}})
             return {
                 'success': False,
-                'error': f"Upload failed: {response.text[:200]}"
+                'error': f"Upload failed: {response.text[:200]}",
+                'limit_reached': is_limit_error(response.status_code, response.text)
             }
             
         except Exception as e:
-            print(f"[ERROR] LuluStream upload error: {e}")
+            logger.error(f"[LULUSTREAM] Upload error: {e}")
             return {
                 'success': False,
-                'error': str(e)
+                'error': str(e),
+                'provider_error': isinstance(e, ProviderUnavailable),
+                'outcome_unknown': isinstance(e, (requests.RequestException, ProviderUnavailable))
             }
     
     def upload_by_url(self, video_url: str, title: str = None, description: str = None,
@@ -154,10 +330,10 @@ class LuluStreamClient:
             data = {}
             
             # Add optional parameters
-            if hasattr(config, 'FOLDER_ID') and config.FOLDER_ID:
-                data['fld_id'] = config.FOLDER_ID
-            if hasattr(config, 'CATEGORY_ID') and config.CATEGORY_ID:
-                data['cat_id'] = config.CATEGORY_ID
+            if self.folder_id:
+                data['fld_id'] = self.folder_id
+            if self.category_id:
+                data['cat_id'] = self.category_id
             
             data['file_public'] = config.FILE_PUBLIC if hasattr(config, 'FILE_PUBLIC') else '1'
             data['file_adult'] = config.FILE_ADULT if hasattr(config, 'FILE_ADULT') else '0'
@@ -171,33 +347,28 @@ class LuluStreamClient:
             elif hasattr(config, 'DEFAULT_TAGS'):
                 data['tags'] = config.DEFAULT_TAGS
             
-            print(f"[LULUSTREAM] === URL UPLOAD REQUEST ===" )
-            print(f"[LULUSTREAM] Video URL: {video_url}")
-            print(f"[LULUSTREAM] Title: {title}")
-            print(f"[LULUSTREAM] API Endpoint: {self.api_base}/upload/url")
-            print(f"[LULUSTREAM] API Key: {self.api_key[:12]}...")
-            print(f"[LULUSTREAM] Query Params: {query_params}")
-            print(f"[LULUSTREAM] POST Data: {data}")
-            
             # Make request - can be either GET or POST according to docs
             # Using POST with additional parameters
-            response = requests.post(url, data=data, timeout=120)
+            started = time.monotonic()
+            response = self._request('post', url, data=data, timeout=120)
             
-            print(f"[LULUSTREAM] === URL UPLOAD RESPONSE ===")
-            print(f"[LULUSTREAM] Status Code: {response.status_code}")
-            print(f"[LULUSTREAM] Response Body: {response.text}")
+            fields = {
+                "url": video_url,
+                "status": response.status_code,
+                "duration_ms": int((time.monotonic() - started) * 1000)
+            }
+            logger.debug("[LULUSTREAM] URL upload response", extra={"fields": {**fields, "body": truncate(response.text)}})
             
             if response.status_code == 200:
                 try:
                     result = response.json()
-                    print(f"[LULUSTREAM] Parsed JSON: {result}")
                     
                     # Check response format: {"msg": "OK", "status": 200, "result": {"filecode": "xxx"}}
                     if result.get('msg') == 'OK' or result.get('status') == 200:
                         if result.get('result'):
                             filecode = result['result'].get('filecode')
                             if filecode:
-                                print(f"[LULUSTREAM] ✅ SUCCESS - Filecode: {filecode}")
+                                logger.info("[LULUSTREAM] URL upload done", extra={"fields": {**fields, "filecode": filecode}})
                                 return {
                                     'success': True,
                                     'filecode': filecode,
@@ -207,32 +378,32 @@ class LuluStreamClient:
                     # Check for error message
                     error_msg = result.get('msg') or result.get('error') or result.get('message')
                     if error_msg and error_msg != 'OK':
-                        print(f"[LULUSTREAM] ❌ API Error: {error_msg}")
+                        logger.warning("[LULUSTREAM] URL upload rejected", extra={"fields": {**fields, "error": truncate(error_msg)}})
                         return {
                             'success': False,
-                            'error': f"LuluStream API error: {error_msg}"
+                            'error': f"LuluStream API error: {error_msg}",
+                            'limit_reached': is_limit_error(response.status_code, error_msg)
                         }
                     
                 except ValueError as e:
-                    print(f"[LULUSTREAM] ❌ JSON Parse Error: {e}")
-                    pass
+                    logger.warning(f"[LULUSTREAM] URL upload response is not JSON: {e}")
             
             # If we got here, something went wrong
             error_text = response.text[:500] if len(response.text) > 500 else response.text
-            print(f"[LULUSTREAM] ❌ Upload failed: {error_text}")
+            logger.warning("[LULUSTREAM] URL upload failed", extra={"fields": {**fields, "body": truncate(error_text)}})
             
             return {
                 'success': False,
-                'error': f"URL upload failed (Status {response.status_code}): {error_text}"
+                'error': f"URL upload failed (Status {response.status_code}): {error_text}",
+                'limit_reached': is_limit_error(response.status_code, error_text)
             }
             
         except Exception as e:
-            print(f"[LULUSTREAM] ❌ EXCEPTION: {e}")
-            import traceback
-            print(f"[LULUSTREAM] Traceback: {traceback.format_exc()}")
+            logger.exception(f"[LULUSTREAM] URL upload error: {e}")
             return {
                 'success': False,
-                'error': f"Exception: {str(e)}"
+                'error': f"Exception: {str(e)}",
+                'provider_error': isinstance(e, ProviderUnavailable)
             }
     
     def get_file_info(self, filecode: str) -> Optional[Dict]:
@@ -247,14 +418,78 @@ class LuluStreamClient:
                 'file_code': filecode
             }
             
-            response = requests.get(url, params=params, timeout=30)
+            response = self._request('get', url, params=params, timeout=30)
             
             if response.status_code == 200:
                 return response.json()
             
             return None
         except Exception as e:
-            print(f"[ERROR] Get file info error: {e}")
+            logger.error(f"[LULUSTREAM] Get file info error: {e}", extra={"fields": {"filecode": filecode}})
+            return None
+    
+    def rename_file(self, filecode: str, title: str) -> bool:
+        """
+        Change a file's title
+        GET https://lulustream.com/api/file/edit?key={api_key}&file_code={filecode}&file_title={title}
+        """
+        try:
+            url = f"{self.api_base}/file/edit"
+            params = {
+                'key': self.api_key,
+                'file_code': filecode,
+                'file_title': title
+            }
+            
+            response = self._request('get', url, params=params, timeout=30)
+            
+            if response.status_code == 200 and response.json().get('status') == 200:
+                return True
+            
+            logger.warning("[LULUSTREAM] Rename failed", extra={"fields": {
+                "filecode": filecode, "status": response.status_code, "body": truncate(response.text)
+            }})
+            return False
+        except Exception as e:
+            logger.error(f"[LULUSTREAM] Rename error: {e}", extra={"fields": {"filecode": filecode}})
+            return False
+    
+    def list_files(self, page: int = 1, per_page: int = 100, created: str = None) -> Optional[Dict]:
+        """
+        List files in this account's folder, newest first
+        GET https://lulustream.com/api/file/list?key={api_key}&fld_id={folder}&page={page}&per_page={n}
+        
+        created limits the list to files uploaded after "YYYY-MM-DD HH:MM:SS"
+        
+        Returns:
+            {"files": [...], "pages": n} or None on error
+        """
+        try:
+            url = f"{self.api_base}/file/list"
+            params = {
+                'key': self.api_key,
+                'page': page,
+                'per_page': per_page
+            }
+            if self.folder_id:
+                params['fld_id'] = self.folder_id
+            if created:
+                params['created'] = created
+            
+            response = self._request('get', url, params=params, timeout=60)
+            
+            if response.status_code == 200:
+                data = response.json()
+                result = data.get('result') or {}
+                if data.get('status') == 200 and isinstance(result, dict):
+                    return {'files': result.get('files') or [], 'pages': int(result.get('pages') or 1)}
+            
+            logger.warning("[LULUSTREAM] File list failed", extra={"fields": {
+                "status": response.status_code, "body": truncate(response.text)
+            }})
+            return None
+        except Exception as e:
+            logger.error(f"[LULUSTREAM] File list error: {e}")
             return None
     
     def get_encoding_status(self, filecode: str) -> Optional[Dict]:
@@ -269,12 +504,12 @@ class LuluStreamClient:
                 'file_code': filecode
             }
             
-            response = requests.get(url, params=params, timeout=30)
+            response = self._request('get', url, params=params, timeout=30)
             
             if response.status_code == 200:
                 return response.json()
             
             return None
         except Exception as e:
-            print(f"[ERROR] Get encoding status error: {e}")
+            logger.error(f"[LULUSTREAM] Get encoding status error: {e}", extra={"fields": {"filecode": filecode}})
             return None
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import List
+
+import aiohttp
+
+import config
+import http_pool
+
+logger = logging.getLogger(__name__)
+
+# Answers that mean the link itself is wrong, not that the host is busy
+DEAD_STATUSES = {400, 401, 403, 404, 410, 451}
+
+def probe_result(**fields) -> dict:
+    result = {
+        "ok": True,            # False = dead link, don't queue it
+        "status": None,        # HTTP status of the probe
+        "size": 0,             # 0 = unknown
+        "content_type": None,
+        "accepts_ranges": None,
+        "final_url": None,     # After redirects
+        "error": None,
+        "checked_at": datetime.utcnow()
+    }
+    result.update(fields)
+    return result
+
+class Preflight:
+    """Probe source URLs (size, type, Range support, redirects) before they are queued
+
+    HEAD first, a one-byte ranged GET for hosts that don't answer HEAD properly.
+    Requests go through the source pool with their own per-host allowance, so they
+    don't wait behind downloads, and results are cached per URL for the worker
+    that later downloads it.
+    """
+
+    def __init__(self, concurrency: int, timeout: float, cache_seconds: int):
+        self.semaphore = asyncio.Semaphore(max(1, concurrency))
+        self.seconds = timeout
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.cache_seconds = cache_seconds
+        self.cache = {}  # url -> (fetched_at, result)
+
+    async def probe(self, url: str) -> dict:
+        """Probe one URL, a cached result is reused"""
+        cached = self.cache.get(url)
+        if cached and time.monotonic() - cached[0] < self.cache_seconds:
+            return cached[1]
+
+        async with self.semaphore:
+            try:
+                # The timeout covers the whole probe, including any wait for a host slot
+                result = await asyncio.wait_for(self._probe(url), timeout=self.seconds)
+            except Exception as e:
+                # Network trouble is not proof the link is dead, the worker tries anyway
+                result = probe_result(error=str(e) or type(e).__name__)
+
+        if result["error"]:
+            logger.warning(f"[PREFLIGHT] {url}: {result['error']}")
+        self.cache[url] = (time.monotonic(), result)
+        return result
+
+    async def _probe(self, url: str) -> dict:
+        result = await self._head(url)
+        if not result["ok"] or not result["size"]:
+            # Some hosts refuse HEAD or leave out the length, ask for one byte instead
+            ranged = await self._ranged_get(url)
+            if ranged["ok"] or not result["ok"]:
+                result = ranged
+        return result
+
+    async def probe_many(self, urls: List[str]) -> List[dict]:
+        """Probe several URLs at the same time, results in the same order"""
+        return await asyncio.gather(*(self.probe(url) for url in urls))
+
+    async def _head(self, url: str) -> dict:
+        async with http_pool.get_pool().request(
+            "HEAD", url, probe=True, allow_redirects=True, timeout=self.timeout
+        ) as response:
+            return self._result(response, response.content_length or 0)
+
+    async def _ranged_get(self, url: str) -> dict:
+        async with http_pool.get_pool().request(
+            "GET", url, probe=True, headers={"Range": "bytes=0-0"}, allow_redirects=True, timeout=self.timeout
+        ) as response:
+            size = 0
+            if response.status == 206:
+                # Content-Range: bytes 0-0/12345
+                total = response.headers.get("Content-Range", "").rpartition("/")[2]
+                size = int(total) if total.isdigit() else 0
+            elif response.status == 200:
+                # No Range support, the length is the whole file; don't read the body
+                size = response.content_length or 0
+            result = self._result(response, size)
+            if response.status == 206:
+                result["accepts_ranges"] = True
+            return result
+
+    def _result(self, response, size: int) -> dict:
+        status = response.status
+        content_type = response.headers.get("Content-Type", "").split(";")[0].strip() or None
+        ranges = response.headers.get("Accept-Ranges", "").lower()
+
+        result = probe_result(
+            status=status,
+            size=size if status in (200, 206) else 0,
+            content_type=content_type,
+            accepts_ranges=True if ranges == "bytes" else (False if ranges == "none" else None),
+            final_url=str(response.url)
+        )
+
+        if status in DEAD_STATUSES:
+            result.update(ok=False, error=f"HTTP {status}")
+        elif status in (200, 206) and content_type == "text/html":
+            # A web page, usually an expired share link or a login wall
+            result.update(ok=False, error="Link is a web page, not a file")
+        elif status >= 400:
+            result.update(error=f"HTTP {status}")
+        return result
+
+_preflight = None
+
+def get_preflight() -> Preflight:
+    """Get the process-wide URL prober"""
+    global _preflight
+    if _preflight is None:
+        _preflight = Preflight(
+            concurrency=config.PREFLIGHT_CONCURRENCY,
+            timeout=config.PREFLIGHT_TIMEOUT,
+            cache_seconds=config.PREFLIGHT_CACHE_SECONDS
+        )
+    return _preflight
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import time
+
+from telegram.error import BadRequest
+
+import config
+import sender
+
+logger = logging.getLogger(__name__)
+
+def format_size(size_bytes):
+    """Format bytes to human readable size"""
+    if not size_bytes:
+        return "Unknown"
+
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size_bytes < 1024.0:
+            return f"{size_bytes:.2f} {unit}"
+        size_bytes /= 1024.0
+    return f"{size_bytes:.2f} TB"
+
+def format_duration(seconds: float) -> str:
+    """Format seconds as 1h 2m / 3m 4s / 5s"""
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m {seconds % 60}s"
+    return f"{seconds}s"
+
+class TransferProgress:
+    """Byte counter for one transfer phase
+
+    The hot path only does `done += n`, everything else happens when the
+    reporter samples it, so tracking costs nothing per chunk.
+    """
+    __slots__ = ("phase", "total", "done", "started_at")
+
+    def __init__(self, phase: str = "download", total: int = 0):
+        self.start(phase, total)
+
+    def start(self, phase: str, total: int = 0):
+        self.phase = phase
+        self.total = total or 0
+        self.done = 0
+        self.started_at = time.monotonic()
+
+    def add(self, n: int):
+        self.done += n
+
+class ProgressReporter:
+    """Keep one Telegram status message per item up to date, throttled to stay under edit limits"""
+
+    PHASE_ICONS = {"download": "⬇️ Downloading", "upload": "⬆️ Uploading"}
+
+    def __init__(self, bot, chat_id: int, title: str, progress: TransferProgress,
+                 interval: float = None):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.title = title
+        self.progress = progress
+        self.interval = interval or config.PROGRESS_EDIT_SECONDS
+
+        self.message_id = None
+        self.last_text = None
+        self.last_sample = (progress.started_at, 0)
+        self.speed = 0.0
+        self._task = None
+
+    def render(self) -> str:
+        """Build status text with percentage, throughput and ETA"""
+        p = self.progress
+        now = time.monotonic()
+
+        # Smoothed throughput since the last sample
+        last_time, last_done = self.last_sample
+        if p.done < last_done:
+            last_time, last_done = p.started_at, 0  # New phase started
+        if now - last_time >= 1:
+            current = (p.done - last_done) / (now - last_time)
+            self.speed = current if not self.speed else 0.3 * current + 0.7 * self.speed
+            self.last_sample = (now, p.done)
+
+        lines = [f"{self.PHASE_ICONS.get(p.phase, p.phase)}: {self.title}"]
+
+        if p.total:
+            percent = min(100, p.done * 100 // p.total)
+            lines.append(f"📊 {percent}% • {format_size(p.done)} / {format_size(p.total)}")
+        else:
+            lines.append(f"📊 {format_size(p.done)}")
+
+        speed_text = f"⚡ {format_size(self.speed)}/s"
+        if p.total and self.speed > 0:
+            speed_text += f" • ETA {format_duration((p.total - p.done) / self.speed)}"
+        lines.append(speed_text)
+
+        return "\n".join(lines)
+
+    async def _send(self, text: str):
+        """Send or edit the status message, skipping no-op edits"""
+        if text == self.last_text:
+            return
+
+        # Lowest priority: posts and replies go first, flood waits are handled by the queue
+        try:
+            if self.message_id is None:
+                message = await sender.send(self.chat_id, lambda: self.bot.send_message(
+                    chat_id=self.chat_id, text=text
+                ), sender.PRIORITY_PROGRESS)
+                self.message_id = message.message_id
+            else:
+                await sender.send(self.chat_id, lambda: self.bot.edit_message_text(
+                    chat_id=self.chat_id, message_id=self.message_id, text=text
+                ), sender.PRIORITY_PROGRESS)
+            self.last_text = text
+        except BadRequest as e:
+            # "Message is not modified" and similar are harmless
+            logger.debug(f"[PROGRESS] Edit skipped: {e}")
+        except Exception as e:
+            logger.error(f"[PROGRESS] Update failed: {e}")
+
+    async def _run(self):
+        while True:
+            await self._send(self.render())
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self.chat_id and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def finish(self, text: str):
+        """Stop periodic updates and leave a final status"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            await self._send(f"{text}: {self.title}")
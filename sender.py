@@ -0,0 +1,191 @@
+import asyncio
+import itertools
+import logging
+import time
+from typing import Awaitable, Callable
+
+from telegram.error import RetryAfter
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Lower numbers are sent first
+PRIORITY_POST = 0
+PRIORITY_REPLY = 1
+PRIORITY_BULK = 2
+PRIORITY_PROGRESS = 3
+
+class TokenBucket:
+    """Allow `rate` calls per second with bursts of up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def wait_time(self) -> float:
+        """Seconds until a call may go out, 0 if it may go now"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def pause(self, seconds: float):
+        """Send nothing for `seconds`, after a flood-control error"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+class SendQueue:
+    """Every outbound Telegram message goes through one prioritized queue
+
+    A global bucket keeps the bot under Telegram's overall limit and one bucket
+    per chat under the per-chat limit, so bursts wait here instead of failing.
+    RetryAfter pauses the chat and puts the call back in its place in line.
+    """
+
+    def __init__(self, global_rate: float, chat_rate: float, group_rate: float, burst: int = 3):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.burst = burst
+        self.buckets = {}  # chat_id -> TokenBucket
+
+        self.jobs = []  # (priority, seq, chat_id, call, future)
+        self._seq = itertools.count()
+        self._wake = None
+        self._task = None
+        self._running = set()
+
+        self.sent = 0
+        self.flood_waits = 0
+
+    def _bucket(self, chat_id) -> TokenBucket:
+        if chat_id not in self.buckets:
+            # Groups and channels (negative IDs or @names) get far fewer messages per minute
+            is_group = not isinstance(chat_id, int) or chat_id < 0
+            rate = self.group_rate if is_group else self.chat_rate
+            self.buckets[chat_id] = TokenBucket(rate, self.burst)
+        return self.buckets[chat_id]
+
+    def start(self):
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def send(self, chat_id, call: Callable[[], Awaitable], priority: int = PRIORITY_REPLY,
+                   wait: bool = True):
+        """
+        Queue call() for chat_id and return its result
+        wait=False returns at once, failures are only logged.
+        """
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        self.jobs.append((priority, next(self._seq), chat_id, call, future))
+        self._wake.set()
+
+        if not wait:
+            future.add_done_callback(_log_failure)
+            return None
+        return await future
+
+    async def _run(self):
+        while True:
+            delay = self._dispatch()
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def _dispatch(self):
+        """Start every job the buckets allow, highest priority first; returns seconds until the next one could go"""
+        # Callers that gave up don't need their message any more
+        self.jobs = [job for job in self.jobs if not job[4].done()]
+        next_delay = None
+
+        for job in sorted(self.jobs):
+            global_wait = self.global_bucket.wait_time()
+            if global_wait:
+                return global_wait
+
+            chat_wait = self._bucket(job[2]).wait_time()
+            if chat_wait:
+                # A busy chat doesn't hold back messages to other chats
+                next_delay = chat_wait if next_delay is None else min(next_delay, chat_wait)
+                continue
+
+            self.global_bucket.take()
+            self._bucket(job[2]).take()
+            self.jobs.remove(job)
+            task = asyncio.create_task(self._execute(job))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+        return next_delay
+
+    async def _execute(self, job: tuple):
+        _, _, chat_id, call, future = job
+        try:
+            result = await call()
+        except RetryAfter as e:
+            self.flood_waits += 1
+            logger.warning(f"[SENDER] Flood control in {chat_id}, retrying in {e.retry_after}s")
+            self._bucket(chat_id).pause(e.retry_after)
+            self.jobs.append(job)
+            self._wake.set()
+            return
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+
+        self.sent += 1
+        if not future.done():
+            future.set_result(result)
+
+    async def drain(self, timeout: float):
+        """Give queued messages up to `timeout` seconds to go out, e.g. on shutdown"""
+        deadline = time.monotonic() + timeout
+        while (self.jobs or self._running) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+
+    def summary(self) -> str:
+        return f"{self.sent} sent, {len(self.jobs)} queued, {self.flood_waits} flood waits"
+
+def _log_failure(future: asyncio.Future):
+    if not future.cancelled() and future.exception():
+        logger.error(f"[SENDER] Send failed: {future.exception()}")
+
+_sender = None
+
+def get_sender() -> SendQueue:
+    """Get the process-wide send queue"""
+    global _sender
+    if _sender is None:
+        _sender = SendQueue(
+            global_rate=config.SEND_GLOBAL_PER_SECOND,
+            chat_rate=config.SEND_CHAT_PER_SECOND,
+            group_rate=config.SEND_GROUP_PER_MINUTE / 60
+        )
+    return _sender
+
+async def send(chat_id, call: Callable[[], Awaitable], priority: int = PRIORITY_REPLY, wait: bool = True):
+    """Queue a Telegram call, see SendQueue.send"""
+    return await get_sender().send(chat_id, call, priority, wait)
+
+async def reply(message, text: str, priority: int = PRIORITY_REPLY, wait: bool = True, **kwargs):
+    """message.reply_text through the send queue"""
+    return await get_sender().send(
+        message.chat_id, lambda: message.reply_text(text, **kwargs), priority, wait
+    )
@@ -0,0 +1,293 @@
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import config
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+TEMP_PREFIX = "temp_"
+
+# ==================== TEMP FILES ====================
+
+def ensure_temp_dir():
+    """Create the temp directory if it does not exist"""
+    os.makedirs(config.TEMP_DIR, exist_ok=True)
+
+def temp_path(queue_id: str) -> str:
+    """Get temp file path for a queue item"""
+    return os.path.join(config.TEMP_DIR, f"{TEMP_PREFIX}{queue_id}.mp4")
+
+def remove_file(file_path: Optional[str]):
+    """Remove a file, ignoring missing files"""
+    if not file_path:
+        return
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.error(f"[STORAGE] Failed to remove {file_path}: {e}")
+
+def cleanup_orphans(keep: set = frozenset()) -> int:
+    """Remove temp files left behind by a previous run, except for queue IDs in keep"""
+    ensure_temp_dir()
+    removed = 0
+    keep_names = {os.path.basename(temp_path(queue_id)) for queue_id in keep}
+
+    for name in os.listdir(config.TEMP_DIR):
+        if not name.startswith(TEMP_PREFIX) or name in keep_names:
+            continue
+
+        remove_file(os.path.join(config.TEMP_DIR, name))
+        removed += 1
+
+    if removed:
+        logger.info(f"[STORAGE] Removed {removed} orphaned temp files")
+    return removed
+
+# ==================== DISK ADMISSION ====================
+
+class DiskAdmission:
+    """Reserve temp disk space for in-flight items before they download"""
+
+    def __init__(self, path: str, limit_bytes: int = 0, headroom_bytes: int = 0):
+        self.path = path
+        self.limit_bytes = limit_bytes
+        self.headroom_bytes = headroom_bytes
+        self.reservations = {}  # queue_id -> (size, file_path)
+        self._cond = asyncio.Condition()
+
+    @property
+    def reserved_bytes(self) -> int:
+        return sum(size for size, _ in self.reservations.values())
+
+    def capacity(self) -> int:
+        """Largest single item that could ever be admitted"""
+        total = shutil.disk_usage(self.path).total - self.headroom_bytes
+        if self.limit_bytes:
+            return min(total, self.limit_bytes)
+        return total
+
+    def available(self) -> int:
+        """Bytes that can still be reserved right now"""
+        # Bytes already written by in-flight items are missing from the free
+        # space but still counted in their reservation, so add them back
+        written = 0
+        for _, file_path in self.reservations.values():
+            try:
+                written += os.path.getsize(file_path)
+            except OSError:
+                pass
+
+        free = shutil.disk_usage(self.path).free + written - self.reserved_bytes - self.headroom_bytes
+        if self.limit_bytes:
+            return min(free, self.limit_bytes - self.reserved_bytes)
+        return free
+
+    @asynccontextmanager
+    async def reserve(self, queue_id: str, size: int, file_path: str):
+        """Wait until `size` bytes are free, hold them while the item is in flight"""
+        if size > self.capacity():
+            raise Exception(f"File too large for temp storage ({size // MB} MB)")
+
+        # A resumed partial file already occupies part of the space it needs
+        try:
+            existing = os.path.getsize(file_path)
+        except OSError:
+            existing = 0
+
+        async with self._cond:
+            waiting = False
+            while size - existing > self.available():
+                # Cached sources are given up before an item is made to wait
+                if get_cache().evict(size - existing - self.available()):
+                    continue
+                if not waiting:
+                    logger.info(f"[STORAGE] Waiting for {size // MB} MB of disk space for {queue_id}")
+                    waiting = True
+                # Re-check periodically, space can also be freed outside the bot
+                try:
+                    await asyncio.wait_for(self._cond.wait(), timeout=5)
+                except asyncio.TimeoutError:
+                    pass
+
+            self.reservations[queue_id] = (size, file_path)
+
+        try:
+            yield
+        finally:
+            async with self._cond:
+                self.reservations.pop(queue_id, None)
+                self._cond.notify_all()
+
+    async def settle(self, queue_id: str, file_path: Optional[str]):
+        """Shrink a reservation to the finished file's actual size, None drops it"""
+        # The file is already written, so this only frees the unused part of the estimate;
+        # it keeps counting towards TEMP_DISK_LIMIT_MB while the item is still in flight
+        async with self._cond:
+            if file_path:
+                self.reservations[queue_id] = (os.path.getsize(file_path), file_path)
+            else:
+                self.reservations.pop(queue_id, None)
+            self._cond.notify_all()
+
+_admission = None
+
+def get_admission() -> DiskAdmission:
+    """Get the process-wide disk admission controller"""
+    global _admission
+    if _admission is None:
+        ensure_temp_dir()
+        _admission = DiskAdmission(
+            config.TEMP_DIR,
+            limit_bytes=config.TEMP_DISK_LIMIT_MB * MB,
+            headroom_bytes=config.TEMP_DISK_HEADROOM_MB * MB
+        )
+    return _admission
+
+# ==================== SOURCE CACHE ====================
+
+class SourceCache:
+    """Size-bounded LRU of finished downloads, keyed by file_unique_id or source URL"""
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # file name -> size, least recently used first
+        self.total_bytes = 0
+        self.pins = {}  # file name -> items using it right now
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self.enabled:
+            os.makedirs(path, exist_ok=True)
+            self._load()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def _name(key: str) -> str:
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def _load(self):
+        """Index files cached by a previous run, the access time order is kept in mtime"""
+        files = []
+        for name in os.listdir(self.path):
+            try:
+                st = os.stat(os.path.join(self.path, name))
+            except OSError:
+                continue
+            files.append((st.st_mtime, name, st.st_size))
+
+        for _, name, size in sorted(files):
+            self.entries[name] = size
+            self.total_bytes += size
+
+        self.evict()
+        if self.entries:
+            logger.info(f"[CACHE] {len(self.entries)} cached sources ({self.total_bytes // MB} MB)")
+
+    def get(self, key: Optional[str]) -> Optional[str]:
+        """Path of a cached source, None on a miss"""
+        if not self.enabled or not key:
+            return None
+
+        name = self._name(key)
+        file_path = os.path.join(self.path, name)
+        if name in self.entries and os.path.exists(file_path):
+            self.entries.move_to_end(name)
+            os.utime(file_path)
+            self.hits += 1
+            return file_path
+
+        if name in self.entries:
+            self.total_bytes -= self.entries.pop(name)
+        self.misses += 1
+        return None
+
+    def put(self, key: Optional[str], file_path: str) -> str:
+        """Move a finished download into the cache, returns where the file is now"""
+        if not self.enabled or not key:
+            return file_path
+
+        size = os.path.getsize(file_path)
+        if size > self.max_bytes:
+            return file_path
+
+        name = self._name(key)
+        dest = os.path.join(self.path, name)
+        os.replace(file_path, dest)
+
+        self.total_bytes += size - self.entries.pop(name, 0)
+        self.entries[name] = size
+        self.evict()
+        return dest
+
+    def discard(self, key: Optional[str]):
+        """Drop a source that turned out to be bad"""
+        if not self.enabled or not key:
+            return
+
+        name = self._name(key)
+        if name in self.entries:
+            self.total_bytes -= self.entries.pop(name)
+        remove_file(os.path.join(self.path, name))
+
+    def pin(self, key: Optional[str]):
+        """Keep a source from being evicted while an item is using it"""
+        if key:
+            name = self._name(key)
+            self.pins[name] = self.pins.get(name, 0) + 1
+
+    def unpin(self, key: Optional[str]):
+        if key:
+            name = self._name(key)
+            self.pins[name] -= 1
+            if not self.pins[name]:
+                del self.pins[name]
+
+    def evict(self, needed: int = 0) -> int:
+        """Remove least recently used, unpinned files until the cache fits and `needed` bytes are freed"""
+        freed = 0
+        for name in list(self.entries):
+            if self.total_bytes <= self.max_bytes and freed >= needed:
+                break
+            if name in self.pins:
+                continue
+
+            size = self.entries.pop(name)
+            self.total_bytes -= size
+            remove_file(os.path.join(self.path, name))
+            freed += size
+            self.evictions += 1
+
+        return freed
+
+    def stats(self) -> dict:
+        return {
+            "files": len(self.entries),
+            "bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+_cache = None
+
+def get_cache() -> SourceCache:
+    """Get the process-wide source cache"""
+    global _cache
+    if _cache is None:
+        _cache = SourceCache(os.path.join(config.TEMP_DIR, "cache"), config.SOURCE_CACHE_MB * MB)
+    return _cache
@@ -0,0 +1,783 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import signal
+import socket
+import threading
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+
+import config
+import database
+import http_pool
+import preflight
+import storage
+from accounts import AccountPool, AccountsExhausted
+from circuit import AIMDLimiter, ProviderUnavailable
+from diagnostics import loop_monitor
+from faststart import faststart
+from logs import setup_logging
+from lulustream import provider_breaker
+from progress import ProgressReporter, TransferProgress, format_size
+from telegram import Bot
+
+logger = logging.getLogger(__name__)
+
+# Unique per process, several workers can share one Mongo queue
+WORKER_ID = f"{socket.gethostname()}-{os.getpid()}"
+
+# LuluStream accounts uploads are spread across
+account_pool = AccountPool.from_config()
+
+# Worker state
+worker_running = False
+worker_mode = "embedded"
+worker_task = None
+heartbeat_task = None
+reconcile_task = None
+current_items = {}  # queue_id -> file name
+in_flight_tasks = set()
+processed_count = 0
+
+# Upload slots, shrinks while LuluStream is failing
+limiter = AIMDLimiter(config.WORKER_CONCURRENCY)
+
+# Bot used for progress messages
+telegram_bot = None
+
+class IntegrityError(Exception):
+    """Bytes downloaded, sent or stored by LuluStream don't add up"""
+
+class UploadCancelled(Exception):
+    """Raised in the upload thread to stop sending once its item was cancelled"""
+
+# ==================== HELPER FUNCTIONS ====================
+
+def get_bot() -> Bot:
+    """Get the Telegram bot used by this worker"""
+    global telegram_bot
+    if telegram_bot is None:
+        if config.TELEGRAM_API_URL:
+            # Local Bot API server, lifts the 20 MB download limit
+            base = config.TELEGRAM_API_URL.rstrip("/")
+            telegram_bot = Bot(token=config.BOT_TOKEN, base_url=f"{base}/bot", base_file_url=f"{base}/file/bot")
+        else:
+            telegram_bot = Bot(token=config.BOT_TOKEN)
+    return telegram_bot
+
+async def download_file_from_url(url: str, file_path: str, progress: TransferProgress = None,
+                                 resume_from: int = 0, digest=None) -> bool:
+    """Download file from URL, continuing a partial file from resume_from bytes when the server supports it
+    
+    digest (a hashlib object) is fed the bytes as they arrive; it only covers
+    the whole file when the download started from zero.
+    """
+    try:
+        headers = {"Range": f"bytes={resume_from}-"} if resume_from else {}
+        
+        async with http_pool.get_pool().request("GET", url, headers=headers) as response:
+            if response.status in (200, 206):
+                # 200 to a Range request means the server sent the whole file again
+                mode = 'ab' if response.status == 206 else 'wb'
+                if progress and response.status == 206:
+                    progress.add(resume_from)
+                
+                received = 0
+                with open(file_path, mode) as f:
+                    while True:
+                        chunk = await response.content.read(1024 * 1024)  # 1MB chunks
+                        if not chunk:
+                            break
+                        f.write(chunk)
+                        received += len(chunk)
+                        if digest:
+                            digest.update(chunk)
+                        if progress:
+                            progress.add(len(chunk))
+                
+                # A dropped connection can end the body early without an error
+                expected = response.content_length
+                if expected is not None and received != expected:
+                    logger.error(f"Truncated download: got {received} of {expected} bytes")
+                    return False
+                return True
+            else:
+                logger.error(f"Failed to download file: {response.status}")
+                return False
+    except Exception as e:
+        logger.error(f"Download error: {e}")
+        return False
+
+async def probe_provider():
+    """Let a cheap request be the circuit's trial call, not an upload that may run for hours"""
+    await asyncio.to_thread(account_pool.accounts[0].client.get_upload_server, True)
+
+async def warm_upload_servers():
+    """Fetch upload server URLs for all accounts so the first upload doesn't wait"""
+    await asyncio.gather(*(
+        asyncio.to_thread(account.client.get_upload_server)
+        for account in account_pool.accounts
+    ))
+
+async def cleanup_temp_files():
+    """Remove orphaned temp files, keeping partial downloads a requeued item can resume"""
+    keep = await database.get_checkpointed_ids()
+    await asyncio.to_thread(storage.cleanup_orphans, keep)
+
+# ==================== HEARTBEAT ====================
+
+async def heartbeat_loop():
+    """Keep this worker registered and requeue items of dead workers"""
+    while worker_running:
+        try:
+            await database.register_worker(WORKER_ID, {
+                "host": socket.gethostname(),
+                "pid": os.getpid(),
+                "mode": worker_mode,
+                "current_items": list(current_items.values()),
+                "concurrency": int(limiter.limit),
+                "prefetched": len(prefetcher.items),
+                "processed": processed_count,
+                "cache": storage.get_cache().stats(),
+                "hosts": http_pool.get_pool().stats(),
+                "loop_lag_ms": loop_monitor.max_lag_ms
+            })
+            
+            requeued = await database.requeue_orphaned_uploads()
+            if requeued:
+                logger.warning(f"[WORKER] Requeued {requeued} uploads from dead workers")
+        except Exception as e:
+            logger.error(f"[WORKER] Heartbeat error: {e}")
+        
+        await asyncio.sleep(config.WORKER_HEARTBEAT_SECONDS)
+
+# ==================== PREFETCH ====================
+
+class ClaimPrefetcher:
+    """Claimed items waiting for a free slot, refilled in the background
+
+    Holds about as many items as the worker can run at once, so a finished
+    transfer hands its slot straight to the next item without a Mongo query.
+    The items are claimed like running ones (uploading, this worker's ID), so a
+    crash is covered by the heartbeat; stop() hands them back to pending.
+    """
+
+    def __init__(self, worker_id: str, max_items: int = 0, poll_seconds: float = 10):
+        self.worker_id = worker_id
+        self.max_items = max_items
+        self.poll_seconds = poll_seconds
+        self.items = deque()
+        self._wanted = None     # Set when the buffer should be topped up
+        self._available = None  # Set when items were added
+        self._task = None
+        self._stopping = False
+
+    def target(self) -> int:
+        """Items to keep ready, follows the adaptive concurrency"""
+        return max(1, min(self.max_items or int(limiter.limit), int(limiter.limit)))
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._wanted = asyncio.Event()
+            self._available = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while not self._stopping:
+            self._wanted.clear()
+            missing = self.target() - len(self.items)
+            
+            # Nothing is claimed until LuluStream is back, other workers may get there first
+            if missing > 0 and provider_breaker.state == "closed":
+                claimed = await database.claim_uploads(self.worker_id, missing)
+                if claimed:
+                    self.items.extend(claimed)
+                    self._available.set()
+            
+            # Topped up again as soon as an item is taken, polls while the queue is empty
+            try:
+                await asyncio.wait_for(self._wanted.wait(), timeout=self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    async def take(self) -> dict:
+        """Next claimed item, waits until there is one"""
+        while not self.items:
+            self._available.clear()
+            self._wanted.set()
+            await self._available.wait()
+        
+        video = self.items.popleft()
+        self._wanted.set()
+        return video
+
+    async def stop(self):
+        """Stop claiming and give the items that never started back to pending"""
+        if self._task:
+            # Not cancelled: a claim cut off mid-way would leave items claimed that nobody holds
+            self._stopping = True
+            self._wanted.set()
+            await self._task
+            self._task = None
+        
+        queue_ids = [str(video['_id']) for video in self.items]
+        self.items.clear()
+        if queue_ids:
+            released = await database.release_claims(queue_ids, self.worker_id)
+            logger.info(f"[WORKER] Released {released} prefetched items")
+
+prefetcher = ClaimPrefetcher(WORKER_ID, config.PREFETCH_CLAIMS)
+
+# ==================== WORKER FUNCTIONS ====================
+
+async def upload_worker():
+    """Background worker to upload videos to LuluStream"""
+    logger.info(f"[WORKER] Started ({WORKER_ID})")
+    
+    while worker_running:
+        try:
+            # Wait for a free slot under the adaptive concurrency limit
+            await limiter.acquire()
+            
+            # Don't claim work LuluStream can't take right now
+            wait = provider_breaker.retry_after()
+            if wait:
+                await limiter.release()
+                logger.info(f"[WORKER] LuluStream unavailable, pausing {wait:.0f}s")
+                await asyncio.sleep(wait)
+                continue
+            
+            # Recovering: a cheap request decides whether the circuit closes again
+            if provider_breaker.state != "closed":
+                await limiter.release()
+                await probe_provider()
+                continue
+            
+            # Already claimed by the prefetcher, only waits when the queue is empty
+            try:
+                video = await prefetcher.take()
+            except BaseException:
+                # Cancelled while waiting (shutdown), the slot was never handed to an item
+                await limiter.release()
+                raise
+            
+            task = asyncio.create_task(process_item(video))
+            in_flight_tasks.add(task)
+            task.add_done_callback(in_flight_tasks.discard)
+        
+        except Exception as e:
+            logger.error(f"[WORKER] Error: {e}")
+            await asyncio.sleep(5)
+    
+    logger.info("[WORKER] Stopped")
+
+async def resolve_source(video: dict) -> tuple:
+    """Get the download URL and size (0 if unknown) of a queue item"""
+    # Download file if URL provided
+    if video.get('file_url'):
+        source_url = video['file_url']
+        size = video.get('file_size')
+        if not size:
+            # Usually answered from the probe made when the URL was queued
+            probe = await preflight.get_preflight().probe(source_url)
+            if not probe['ok']:
+                raise Exception(f"Source unavailable: {probe['error']}")
+            size = probe['size']
+        logger.info(f"[WORKER] Downloading from URL: {source_url}")
+        return source_url, size
+    
+    # Download from Telegram if file_id provided
+    if video.get('file_id'):
+        # The file URL contains the bot token, never log it
+        tg_file = await get_bot().get_file(video['file_id'])
+        logger.info(f"[WORKER] Downloading from Telegram")
+        return tg_file.file_path, video.get('file_size') or tg_file.file_size
+    
+    raise Exception("No file URL or file ID provided")
+
+async def process_item(video: dict):
+    """Download and upload one claimed item, then release its slot"""
+    global processed_count
+    
+    queue_id = str(video['_id'])
+    temp_file = storage.temp_path(queue_id)
+    outcome = "neutral"
+    keep_temp = False
+    
+    logger.info(f"[WORKER] Processing: {video['file_name']}")
+    current_items[queue_id] = video['file_name']
+    
+    progress = TransferProgress("download", video.get('file_size'))
+    reporter = None
+    if config.PROGRESS_UPDATES:
+        reporter = ProgressReporter(get_bot(), video.get('chat_id') or config.ADMIN_ID, video['file_name'], progress)
+        reporter.start()
+    
+    # Progress left by an instance that was stopped mid-transfer
+    partial = video.get('partial') or {}
+    existing = os.path.getsize(temp_file) if partial and os.path.exists(temp_file) else 0
+    downloaded = bool(partial.get('complete')) and existing == partial.get('bytes')
+    source_sha256 = partial.get('sha256') if downloaded else None
+    
+    # A retry or re-upload of the same source skips the download
+    cache = storage.get_cache()
+    cache_key = video.get('file_unique_id') or video.get('file_url')
+    cache.pin(cache_key)
+    
+    try:
+        # An earlier attempt may have reached LuluStream before it was cut off
+        copy = await find_uploaded_copy(video) if video.get('upload_attempt') else None
+        cached_file = None if downloaded or copy else cache.get(cache_key)
+        
+        if copy:
+            if not await record_uploaded_copy(video, copy, from_statuses=("uploading",)):
+                raise Exception("Item changed while reconciling")
+            logger.info(f"[WORKER] Already on LuluStream as {copy['file_code']}, skipping upload")
+        elif cached_file:
+            logger.info(f"[WORKER] Source cached, skipping download")
+            check_source_size(video, cached_file)
+            await upload_and_record(video, queue_id, cached_file, progress)
+        else:
+            source_url, size = await resolve_source(video)
+            
+            # Reserve disk space first, the item waits here until it fits
+            size = size or config.TEMP_UNKNOWN_SIZE_MB * storage.MB
+            if config.FASTSTART:
+                # The remux writes a second copy before swapping it in
+                size *= 2
+            
+            admission = storage.get_admission()
+            async with admission.reserve(queue_id, size, temp_file):
+                if downloaded:
+                    logger.info(f"[WORKER] Reusing completed download from {partial.get('worker_id')}")
+                else:
+                    if existing:
+                        logger.info(f"[WORKER] Resuming download at {format_size(existing)}")
+                    progress.start("download", size)
+                    # A resumed file's first bytes were never seen, so only fresh downloads get a source hash
+                    download_digest = hashlib.sha256() if not existing else None
+                    success = await download_file_from_url(
+                        source_url, temp_file, progress, resume_from=existing, digest=download_digest
+                    )
+                    if not success:
+                        raise Exception("Failed to download file")
+                    downloaded = True
+                    if download_digest:
+                        source_sha256 = download_digest.hexdigest()
+                
+                # A truncated or wrong file never reaches LuluStream
+                check_source_size(video, temp_file)
+                
+                if config.FASTSTART:
+                    # Cached after the remux, so a cache hit is already faststart
+                    remuxed_sha256 = await asyncio.to_thread(faststart, temp_file)
+                    if remuxed_sha256:
+                        logger.info(f"[WORKER] Moved moov to the front")
+                        source_sha256 = remuxed_sha256
+                
+                source_file = cache.put(cache_key, temp_file)
+                
+                # Held at the file's actual size until the upload is done; a cached file
+                # has moved under the cache's own budget, so its reservation ends here
+                await admission.settle(queue_id, source_file if source_file == temp_file else None)
+                await upload_and_record(video, queue_id, source_file, progress, source_sha256)
+        
+        outcome = "success"
+    
+    except asyncio.CancelledError:
+        # Drain timed out: hand the item back with what was transferred so far
+        # A download that already moved into the cache is found there instead
+        saved = os.path.getsize(temp_file) if os.path.exists(temp_file) else 0
+        checkpoint = {
+            "bytes": saved,
+            "complete": downloaded and saved > 0,
+            "sha256": source_sha256,
+            "worker_id": WORKER_ID
+        }
+        keep_temp = checkpoint["bytes"] > 0
+        await database.checkpoint_upload(queue_id, checkpoint)
+        logger.warning(f"[WORKER] Interrupted, requeued with {format_size(checkpoint['bytes'])} saved")
+        raise
+    
+    except ProviderUnavailable as e:
+        # LuluStream outage, not this item's fault: requeue without spending a retry
+        outcome = "provider_error"
+        logger.warning(f"[WORKER] LuluStream unavailable, requeued: {e}")
+        await database.update_upload_status(queue_id, "pending", error_message=str(e), buffered=True)
+    
+    except AccountsExhausted as e:
+        # Quotas, not this item's fault either; the concurrency limit stays as it is
+        outcome = "limit_reached"
+        logger.warning(f"[WORKER] {e}, requeued")
+        await database.update_upload_status(queue_id, "pending", error_message=str(e), buffered=True)
+    
+    except Exception as e:
+        logger.error(f"[WORKER] Upload failed: {e}")
+        
+        # Don't let the retry reuse a source that failed verification
+        if isinstance(e, IntegrityError):
+            cache.discard(cache_key)
+        
+        # The claimed document is current, this worker owns the item until it lets go
+        retry_count = video.get('retry_count', 0) + 1
+        status = "failed" if retry_count >= config.MAX_RETRIES else "pending"
+        await database.update_upload_status(
+            queue_id,
+            status,
+            error_message=str(e),
+            inc_retry=True,
+            buffered=True
+        )
+        
+        if status == "failed":
+            logger.error(f"[WORKER] Max retries reached, marked as failed")
+        else:
+            logger.info(f"[WORKER] Retry {retry_count}/{config.MAX_RETRIES}")
+    
+    finally:
+        if reporter:
+            await reporter.finish({
+                "success": "✅ Uploaded",
+                "provider_error": "⏸ Requeued (LuluStream unavailable)",
+                "limit_reached": "⏸ Requeued (accounts at their limit)"
+            }.get(outcome, "❌ Failed"))
+        if not keep_temp:
+            storage.remove_file(temp_file)
+        cache.unpin(cache_key)
+        current_items.pop(queue_id, None)
+        processed_count += 1
+        await limiter.release(outcome)
+
+def check_source_size(video: dict, file_path: str):
+    """Reject a source that doesn't match the size it was queued with, before it is uploaded"""
+    file_size = os.path.getsize(file_path)
+    if video.get('file_size') and file_size != video['file_size']:
+        raise IntegrityError(f"Downloaded {format_size(file_size)}, source reported {format_size(video['file_size'])}")
+
+async def upload_and_record(video: dict, queue_id: str, file_path: str, progress: TransferProgress = None,
+                            source_sha256: str = None):
+    """Upload a downloaded file to LuluStream, verify it and mark the item uploaded"""
+    tried = ()
+    file_size = os.path.getsize(file_path)
+    
+    while True:
+        account = await account_pool.acquire(exclude=tried)
+        if not account:
+            raise AccountsExhausted("All LuluStream accounts are at their limit")
+        
+        logger.info(f"[WORKER] Uploading to LuluStream ({account.name})...")
+        # The token in the title tells this attempt's file apart from others named video.mp4
+        token = uuid.uuid4().hex[:10]
+        await database.mark_upload_attempt(queue_id, {
+            "account": account.name,
+            "title": video['file_name'],
+            "token": token,
+            "size": file_size,
+            "started_at": datetime.utcnow()
+        })
+        if progress:
+            progress.start("upload", file_size)
+        
+        # Hash and count the bytes as they are sent, the file is read only once
+        sent = TransferProgress("upload", file_size)
+        upload_digest = hashlib.sha256()
+        cancelled = threading.Event()
+        
+        def on_read(chunk):
+            if cancelled.is_set():
+                raise UploadCancelled("Upload cancelled")
+            upload_digest.update(chunk)
+            sent.add(len(chunk))
+            if progress:
+                progress.add(len(chunk))
+        
+        try:
+            # Off the event loop so heartbeats keep flowing during long uploads
+            result = await asyncio.to_thread(
+                account.client.upload_file, file_path, attempt_title(video['file_name'], token), on_read=on_read
+            )
+        except asyncio.CancelledError:
+            # Cancelling the await leaves the thread sending, stop it at its next chunk
+            # so the requeued item isn't uploaded twice and shutdown doesn't wait on it
+            cancelled.set()
+            raise
+        finally:
+            account_pool.release(account)
+        
+        if result and result.get('success'):
+            account.succeeded()
+            break
+        
+        error_msg = result.get('error', 'Unknown error') if result else 'No response'
+        
+        if result and result.get('provider_error'):
+            raise ProviderUnavailable(error_msg)
+        
+        # No answer (timeout, dropped connection): the file may have arrived, keep the
+        # attempt so the retry and the reconcile sweep look for it first
+        if result and result.get('outcome_unknown'):
+            raise Exception(f"Upload failed: {error_msg}")
+        
+        # LuluStream answered and refused the file, there is nothing to find later
+        await database.mark_upload_attempt(queue_id, None)
+        
+        # Quota or rate limit: back off this account and try the next one
+        if result and result.get('limit_reached'):
+            account.back_off(error_msg)
+            tried += (account.name,)
+            continue
+        
+        raise Exception(f"Upload failed: {error_msg}")
+    
+    filecode = result.get('filecode')
+    url = result.get('url')
+    
+    if not filecode or not url:
+        raise Exception("No filecode or URL in response")
+    
+    logger.info(f"[WORKER] Upload successful! Filecode: {filecode}")
+    
+    original_title = None
+    thumbnail_url = None
+    sha256 = upload_digest.hexdigest()
+    
+    try:
+        if sent.done != file_size:
+            raise IntegrityError(f"Sent {sent.done} of {file_size} bytes")
+        if source_sha256 and sha256 != source_sha256:
+            raise IntegrityError("Temp file changed between download and upload")
+        
+        # Get file info from LuluStream to get original title and thumbnail
+        file_info = await asyncio.to_thread(account.client.get_file_info, filecode)
+        
+        if file_info and file_info.get('status') == 200:
+            result_data = file_info.get('result', {})
+            if isinstance(result_data, list) and len(result_data) > 0:
+                result_data = result_data[0]
+            
+            original_title = strip_attempt_token(result_data.get('file_title') or result_data.get('title'), token)
+            thumbnail_url = result_data.get('player_img') or result_data.get('thumbnail')  # ✅ FIXED LINE
+            
+            logger.info(f"[WORKER] Original title: {original_title}")
+            logger.info(f"[WORKER] Thumbnail: {thumbnail_url}")
+            
+            # Not every account reports a size, only compare when it does
+            remote_size = result_data.get('file_size') or result_data.get('size')
+            if str(remote_size or '').isdigit() and int(remote_size) != file_size:
+                raise IntegrityError(f"LuluStream has {remote_size} bytes, uploaded {file_size}")
+    except IntegrityError:
+        # This copy failed verification, reconciliation must not adopt it later
+        await database.mark_upload_attempt(queue_id, None)
+        raise
+    
+    # Update status to uploaded
+    await database.update_upload_status(
+        queue_id,
+        "uploaded",
+        lulustream_file_code=filecode,
+        lulustream_url=url,
+        original_title=original_title,
+        thumbnail_url=thumbnail_url,
+        lulustream_account=account.name,
+        sha256=sha256,
+        verified_size=file_size
+    )
+    await drop_attempt_token(account, filecode, original_title or video['file_name'])
+
+# ==================== RECONCILIATION ====================
+
+# account name -> (fetched_at, since, files) of its last file listing
+listing_cache = {}
+
+def attempt_title(file_name: str, token: str) -> str:
+    """Title an upload is sent with, the token marks which attempt the file came from"""
+    return f"{file_name} [{token}]"
+
+async def drop_attempt_token(account, filecode: str, title: str):
+    """Give a recorded file its clean title back, viewers never see the token"""
+    # After the item is recorded: until then the token is how a cut-off attempt is found
+    if not await asyncio.to_thread(account.client.rename_file, filecode, title):
+        logger.warning(f"[WORKER] {filecode} keeps the attempt token in its title")
+
+def strip_attempt_token(title, token: str):
+    """The title without the attempt token, as captions should show it"""
+    if not title or not token:
+        return title
+    return re.sub(rf"\s*\[{re.escape(token)}\]", "", str(title), flags=re.IGNORECASE).strip()
+
+async def list_recent_files(account, since: datetime) -> list:
+    """Files an account received since `since`, a listing is reused for a minute"""
+    cached = listing_cache.get(account.name)
+    now = datetime.utcnow()
+    if cached and now - cached[0] < timedelta(minutes=1) and cached[1] <= since:
+        return cached[2]
+    
+    # LuluStream's clock and time zone are unknown, so the cutoff is generous
+    created = (since - timedelta(days=1)).strftime("%Y-%m-%d %H:%M:%S")
+    files = []
+    page, pages = 1, 1
+    while page <= min(pages, config.RECONCILE_MAX_PAGES):
+        listing = await asyncio.to_thread(account.client.list_files, page, 100, created)
+        if listing is None:
+            break
+        files += listing['files']
+        pages = listing['pages']
+        page += 1
+    
+    listing_cache[account.name] = (now, since, files)
+    return files
+
+async def find_uploaded_copy(video: dict):
+    """Find the file an interrupted attempt left on LuluStream, matched by its token and size"""
+    attempt = video.get('upload_attempt') or {}
+    token = attempt.get('token')
+    if not attempt.get('started_at') or not token:
+        return None
+    
+    account = account_pool.get(attempt.get('account'))
+    
+    for file in await list_recent_files(account, attempt['started_at']):
+        # LuluStream may change case, the token itself is only hex digits
+        if f"[{token}]" not in str(file.get('title') or "").lower():
+            continue
+        
+        # Not every listing has sizes, only compare when it does
+        size = file.get('size') or file.get('file_size')
+        if str(size or '').isdigit() and attempt.get('size') and int(size) != attempt['size']:
+            continue
+        
+        file_code = file.get('file_code') or file.get('filecode')
+        if not file_code or await database.is_file_code_used(file_code):
+            continue
+        
+        return {**file, 'file_code': file_code, 'account': account.name,
+                'title': strip_attempt_token(file.get('title'), token)}
+    
+    return None
+
+async def record_uploaded_copy(video: dict, copy: dict, from_statuses: tuple = ("pending", "failed")) -> bool:
+    """Mark an item uploaded with a file that is already on LuluStream, nothing is sent again"""
+    recorded = await database.mark_reconciled(str(video['_id']), {
+        "lulustream_file_code": copy['file_code'],
+        "lulustream_url": f"https://luluvid.com/{copy['file_code']}",
+        "original_title": copy.get('title'),
+        "thumbnail_url": copy.get('thumbnail') or copy.get('player_img'),
+        "lulustream_account": copy['account']
+    }, from_statuses)
+    if recorded:
+        await drop_attempt_token(account_pool.get(copy['account']), copy['file_code'],
+                                 copy.get('title') or video['file_name'])
+    return recorded
+
+async def reconcile_items() -> int:
+    """Match every interrupted upload against the LuluStream file lists"""
+    matched = 0
+    for video in await database.get_interrupted_uploads():
+        copy = await find_uploaded_copy(video)
+        if copy and await record_uploaded_copy(video, copy):
+            matched += 1
+            logger.info(f"[RECONCILE] {video['file_name']} is already on LuluStream as {copy['file_code']}")
+    return matched
+
+async def reconcile_loop():
+    """Periodically recover uploads that reached LuluStream but were never recorded"""
+    while worker_running:
+        try:
+            matched = await reconcile_items()
+            if matched:
+                logger.info(f"[RECONCILE] Marked {matched} items uploaded without re-uploading")
+        except Exception as e:
+            logger.error(f"[RECONCILE] Error: {e}")
+        
+        await asyncio.sleep(config.RECONCILE_INTERVAL_MINUTES * 60)
+
+# ==================== CONTROL ====================
+
+async def start_worker(mode: str = "embedded"):
+    """Register this worker and start the upload loop"""
+    global worker_running, worker_mode, worker_task, heartbeat_task, reconcile_task
+    
+    worker_running = True
+    worker_mode = mode
+    
+    # Register before the first claim so the item is never seen as orphaned
+    await database.register_worker(WORKER_ID, {"host": socket.gethostname(), "pid": os.getpid(), "mode": mode})
+    
+    heartbeat_task = asyncio.create_task(heartbeat_loop())
+    prefetcher.start()
+    worker_task = asyncio.create_task(upload_worker())
+    if config.RECONCILE_INTERVAL_MINUTES:
+        reconcile_task = asyncio.create_task(reconcile_loop())
+
+async def stop_worker(grace_seconds: float = 0):
+    """
+    Stop the upload loop and unregister this worker
+    New claims stop at once, in-flight items get grace_seconds to finish.
+    Anything still running after that is requeued with its partial download.
+    """
+    global worker_running
+    
+    worker_running = False
+    
+    if worker_task:
+        worker_task.cancel()
+        try:
+            await worker_task
+        except asyncio.CancelledError:
+            pass
+    
+    # Items claimed ahead go back first, so other workers can start them during the drain
+    await prefetcher.stop()
+    
+    if in_flight_tasks and grace_seconds:
+        logger.info(f"[WORKER] Draining {len(in_flight_tasks)} uploads (up to {grace_seconds}s)")
+        await asyncio.wait(set(in_flight_tasks), timeout=grace_seconds)
+    
+    # Heartbeat last, so draining items are never treated as orphaned
+    for task in (reconcile_task, *in_flight_tasks, heartbeat_task):
+        if task:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+    
+    await database.unregister_worker(WORKER_ID)
+    await http_pool.get_pool().close()
+
+# ==================== MAIN ====================
+
+async def main():
+    """Run a standalone upload worker"""
+    loop_monitor.start()
+    
+    connected, _ = await asyncio.gather(
+        database.connect_db(),
+        warm_upload_servers()
+    )
+    if not connected:
+        return
+    
+    await cleanup_temp_files()
+    
+    await start_worker("standalone")
+    
+    # Run until the container is stopped
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+    
+    await stop_event.wait()
+    
+    await stop_worker(config.DRAIN_GRACE_SECONDS)
+    await database.close_db()
+    logger.info("✅ Worker stopped")
+
+if __name__ == "__main__":
+    setup_logging(config.LOG_LEVEL)
+    asyncio.run(main())